@@ -0,0 +1,93 @@
+import json
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+from pymongo import MongoClient
+
+MONGO_URI = os.getenv("TEST_MONGO_URI", "mongodb://localhost:27017/?serverSelectionTimeoutMS=1000")
+DB_NAME = os.getenv("TEST_DB_NAME", "report_watcher_test")
+
+watcher = None
+
+
+def setUpModule():
+    global watcher
+    try:
+        MongoClient(MONGO_URI).admin.command("ping")
+    except Exception as e:
+        raise unittest.SkipTest(f"mongod not available at {MONGO_URI}: {e}")
+    cfg = tempfile.NamedTemporaryFile("w", suffix=".json", delete=False)
+    json.dump({"mongo_uri": MONGO_URI, "database": DB_NAME, "collection": "qa"}, cfg)
+    cfg.close()
+    os.environ.update({"CONFIG_FILE": cfg.name, "MONGO_URI": MONGO_URI, "DB_NAME": DB_NAME, "OUTBOX_ENABLED": "false"})
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import watcher as w
+    watcher = w
+
+
+def tearDownModule():
+    if watcher:
+        watcher.client.drop_database(DB_NAME)
+
+
+class LeaseManagerTest(unittest.TestCase):
+    def setUp(self):
+        self.coll = watcher.db["leases-test"]
+        self.coll.delete_many({})
+        self.a = watcher.LeaseManager(self.coll, "a", ttl=2)
+        self.b = watcher.LeaseManager(self.coll, "b", ttl=2)
+
+    def test_acquire_is_exclusive(self):
+        self.assertTrue(self.a.acquire("run:1"))
+        self.assertFalse(self.b.acquire("run:1"))
+        self.assertTrue(self.a.acquire("run:1"))
+        self.assertEqual(self.coll.find_one({"_id": "run:1"})["owner"], "a")
+
+    def test_expired_lease_is_reclaimed(self):
+        self.assertTrue(self.a.acquire("run:1", ttl=1))
+        self.assertFalse(self.b.acquire("run:1"))
+        time.sleep(1.5)
+        self.assertTrue(self.b.acquire("run:1"))
+        self.assertEqual(self.coll.find_one({"_id": "run:1"})["owner"], "b")
+        self.a.renew_all()
+        self.assertFalse(self.a.owns("run:1"))
+
+    def test_host_clock_skew_does_not_expire_lease(self):
+        self.assertTrue(self.a.acquire("run:1"))
+        real = watcher._utc_now
+        watcher._utc_now = lambda: real() + watcher.timedelta(hours=1)
+        try:
+            self.assertFalse(self.b.acquire("run:1"))
+        finally:
+            watcher._utc_now = real
+
+    def test_release_and_complete(self):
+        self.assertTrue(self.a.acquire("job:1"))
+        self.a.release("job:1")
+        self.assertTrue(self.b.acquire("job:1"))
+        self.b.complete("job:1")
+        self.assertFalse(self.a.acquire("job:1"))
+        self.assertTrue(self.coll.find_one({"_id": "job:1"})["done"])
+
+    def test_balance_splits_targets(self):
+        targets = [(f"/p{i}", None, None, None, None, f"t{i}") for i in range(4)]
+        self.a.acquire("instance:a")
+        self.b.acquire("instance:b")
+        self.assertEqual(self.a.live_instances(), 2)
+        owned_a = self.a.balance(targets)
+        owned_b = self.b.balance(targets)
+        self.assertEqual(len(owned_a), 2)
+        self.assertEqual(len(owned_b), 2)
+        self.assertFalse({t[5] for t in owned_a} & {t[5] for t in owned_b})
+        self.b.release("instance:b")
+        self.assertEqual(len(self.a.balance(targets)), 2)
+        time.sleep(2.5)
+        self.a.renew_all()
+        self.assertEqual(len(self.a.balance(targets)), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
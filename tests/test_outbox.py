@@ -0,0 +1,157 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+from pymongo.errors import AutoReconnect, DocumentTooLarge
+
+watcher = None
+
+
+def setUpModule():
+    global watcher
+    cfg = tempfile.NamedTemporaryFile("w", suffix=".json", delete=False)
+    json.dump({"mongo_uri": "mongodb://localhost:27017/?serverSelectionTimeoutMS=200", "database": "report_watcher_test", "collection": "qa"}, cfg)
+    cfg.close()
+    os.environ.setdefault("CONFIG_FILE", cfg.name)
+    os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017/?serverSelectionTimeoutMS=200")
+    os.environ["OUTBOX_ENABLED"] = "false"
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import watcher as w
+    watcher = w
+
+
+class StubCollection:
+    def __init__(self, db, name):
+        self.db = db
+        self.name = name
+
+    def bulk_write(self, reqs, ordered=True):
+        with self.db.lock:
+            self.db.calls += 1
+            if self.db.down:
+                raise AutoReconnect("stub is down")
+            for r in reqs:
+                if r._doc.get("bad"):
+                    raise DocumentTooLarge("stub document too large")
+            self.db.docs.extend((self.name, r._doc["n"]) for r in reqs)
+
+
+class StubDb:
+    def __init__(self):
+        self.docs = []
+        self.calls = 0
+        self.down = False
+        self.lock = threading.Lock()
+
+    def __getitem__(self, name):
+        return StubCollection(self, name)
+
+
+class OutboxTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.db = StubDb()
+        self.saved = (watcher.db, watcher.OUTBOX_MAX_BACKOFF_SECONDS)
+        watcher.db = self.db
+        watcher.OUTBOX_MAX_BACKOFF_SECONDS = 0.5
+        self.open = []
+
+    def tearDown(self):
+        for ob in self.open:
+            if ob.thread.is_alive():
+                ob.stop(drain_timeout=1)
+            elif not ob.stopping:
+                ob.writer.close()
+                ob._unlock_dir()
+        watcher.db, watcher.OUTBOX_MAX_BACKOFF_SECONDS = self.saved
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def outbox(self, max_bytes=64 * 1024 * 1024, start=True):
+        ob = watcher.Outbox(self.dir, max_bytes, 50)
+        self.open.append(ob)
+        return ob.start() if start else ob
+
+    def crash(self, ob):
+        with ob.cond:
+            ob.stopping = True
+            ob.cond.notify_all()
+        ob.thread.join(5)
+        ob.writer.close()
+        ob._unlock_dir()
+
+    def put(self, ob, n, coll="x", **extra):
+        doc = {"n": n}
+        doc.update(extra)
+        ob.put(coll, "insert_one", {"document": doc})
+
+    def test_replays_pending_records_in_order_after_restart(self):
+        ob = self.outbox()
+        self.put(ob, 0)
+        self.put(ob, 1)
+        self.assertTrue(ob.drain(5))
+        self.db.down = True
+        for n in range(2, 6):
+            self.put(ob, n, coll="y" if n % 2 else "x")
+        self.crash(ob)
+        self.db.down = False
+        ob2 = self.outbox()
+        self.assertTrue(ob2.drain(5))
+        self.assertEqual([n for _, n in self.db.docs], [0, 1, 2, 3, 4, 5])
+
+    def test_permanent_error_is_dead_lettered_and_later_writes_apply(self):
+        ob = self.outbox()
+        self.put(ob, 0)
+        self.put(ob, 1, bad=True)
+        self.put(ob, 2)
+        self.assertTrue(ob.drain(5))
+        self.assertEqual([n for _, n in self.db.docs], [0, 2])
+        self.assertEqual(ob.stats()["dropped"], 1)
+        with open(os.path.join(self.dir, "dead-letter.log"), "rb") as fh:
+            dead = [json.loads(line) for line in fh]
+        self.assertEqual(dead[0]["a"]["document"]["n"], 1)
+
+    def test_segments_rotate_and_are_removed_once_applied(self):
+        ob = self.outbox(max_bytes=256 * 1024)
+        pad = "p" * 1000
+        for n in range(600):
+            self.put(ob, n, pad=pad)
+        self.assertTrue(ob.drain(10))
+        self.assertEqual(len(self.db.docs), 600)
+        self.assertGreater(ob.write_seq, 2)
+        self.assertLessEqual(len(ob._segments()), 2)
+        self.assertLess(ob.disk_bytes, 256 * 1024)
+
+    def test_backoff_is_not_cut_short_by_puts(self):
+        ob = self.outbox()
+        self.db.down = True
+        deadline = time.monotonic() + 1
+        n = 0
+        while time.monotonic() < deadline:
+            self.put(ob, n)
+            n += 1
+        self.assertLessEqual(ob.stats()["failures"], 5)
+        self.db.down = False
+        self.assertTrue(ob.drain(10))
+        self.assertEqual(len(self.db.docs), n)
+
+    def test_drain_times_out_while_down(self):
+        ob = self.outbox()
+        self.db.down = True
+        self.put(ob, 0)
+        self.assertFalse(ob.drain(0.5))
+        self.db.down = False
+        self.assertTrue(ob.drain(5))
+
+    def test_directory_is_locked(self):
+        self.outbox(start=False)
+        with self.assertRaises(RuntimeError):
+            watcher.Outbox(self.dir, 1024 * 1024, 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,13 +1,40 @@
 import os
+import io
+import sys
 import time
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
 import platform
+from collections import OrderedDict
+import argparse
+import threading
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
-from pymongo import MongoClient, ASCENDING
-from pymongo.errors import DuplicateKeyError
+from pymongo import MongoClient, ASCENDING, ReturnDocument
+from pymongo import InsertOne, UpdateOne, UpdateMany, DeleteOne, DeleteMany
+from pymongo.errors import DuplicateKeyError, BulkWriteError, ConnectionFailure, ExecutionTimeout, WTimeoutError, PyMongoError, OperationFailure
+from bson import encode as bson_encode, json_util
 import re
+if os.name == "nt":
+    import msvcrt
+    fcntl = None
+else:
+    import fcntl
+    msvcrt = None
+import hashlib
+import zlib
+import zipfile
+import tarfile
+import gzip
+import math
+import uuid
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, unquote
+from array import array
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 def _select_config_file():
     env_file = os.getenv("CONFIG_FILE")
@@ -41,19 +68,62 @@ SYNC_INTERVAL_SECONDS = int(os.getenv("SYNC_INTERVAL_SECONDS", "30"))
 ENV_KEY_NAME = os.getenv("ENV_KEY")
 REFRESH_TEST_RUNS = os.getenv("REFRESH_TEST_RUNS", "false").lower() == "true"
 EXIT_AFTER_REFRESH = os.getenv("EXIT_AFTER_REFRESH", "false").lower() == "true"
+BLOB_THRESHOLD_BYTES = int(os.getenv("BLOB_THRESHOLD_BYTES", config.get("blob_threshold_bytes", 8192)))
+BLOB_COLLECTION = os.getenv("BLOB_COLLECTION", config.get("blob_collection", "step-blobs"))
+BLOB_SWEEP_GRACE_HOURS = int(os.getenv("BLOB_SWEEP_GRACE_HOURS", config.get("blob_sweep_grace_hours", 24)))
+BLOB_SWEEP_BATCH = int(os.getenv("BLOB_SWEEP_BATCH", config.get("blob_sweep_batch", 1000)))
+BACKFILL_MAX_OPS = float(os.getenv("BACKFILL_MAX_OPS", config.get("backfill_max_ops", 0)))
+BACKFILL_MAX_MB = float(os.getenv("BACKFILL_MAX_MB", config.get("backfill_max_mb", 0)))
+OUTBOX_ENABLED = os.getenv("OUTBOX_ENABLED", str(config.get("outbox_enabled", True))).lower() == "true"
+OUTBOX_DIR = os.getenv("OUTBOX_DIR", config.get("outbox_dir", ".outbox"))
+OUTBOX_MAX_MB = int(os.getenv("OUTBOX_MAX_MB", config.get("outbox_max_mb", 512)))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", config.get("outbox_batch_size", 500)))
+OUTBOX_FSYNC = os.getenv("OUTBOX_FSYNC", str(config.get("outbox_fsync", False))).lower() == "true"
+OUTBOX_DEAD_LETTER_MB = int(os.getenv("OUTBOX_DEAD_LETTER_MB", config.get("outbox_dead_letter_mb", 64)))
+OUTBOX_MAX_BACKOFF_SECONDS = float(os.getenv("OUTBOX_MAX_BACKOFF_SECONDS", config.get("outbox_max_backoff_seconds", 60)))
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", config.get("retention_days", 0)))
+RETENTION_RUNS = int(os.getenv("RETENTION_RUNS", config.get("retention_runs", 0)))
+RETENTION_INTERVAL_SECONDS = int(os.getenv("RETENTION_INTERVAL_SECONDS", config.get("retention_interval_seconds", 600)))
+RETENTION_BATCH = int(os.getenv("RETENTION_BATCH", config.get("retention_batch", 20)))
+ARCHIVE_COLLECTION = os.getenv("ARCHIVE_COLLECTION", config.get("archive_collection", "test-run-archives"))
+API_ENABLED = os.getenv("API_ENABLED", str(config.get("api_enabled", False))).lower() == "true"
+API_HOST = os.getenv("API_HOST", config.get("api_host", "127.0.0.1"))
+API_PORT = int(os.getenv("API_PORT", config.get("api_port", 8765)))
+API_CACHE_TTL_SECONDS = float(os.getenv("API_CACHE_TTL_SECONDS", config.get("api_cache_ttl_seconds", 300)))
+API_CACHE_MAX_ENTRIES = int(os.getenv("API_CACHE_MAX_ENTRIES", config.get("api_cache_max_entries", 1024)))
+COORDINATION_ENABLED = os.getenv("COORDINATION_ENABLED", str(config.get("coordination_enabled", False))).lower() == "true"
+LEASE_COLLECTION = os.getenv("LEASE_COLLECTION", config.get("lease_collection", "leases"))
+LEASE_TTL_SECONDS = int(os.getenv("LEASE_TTL_SECONDS", config.get("lease_ttl_seconds", 60)))
+INSTANCE_ID = os.getenv("INSTANCE_ID", f"{platform.node()}:{os.getpid()}:{uuid.uuid4().hex[:6]}")
+REPORT_CACHE_MB = int(os.getenv("REPORT_CACHE_MB", config.get("report_cache_mb", 256)))
+REPORT_FACTS_MB = int(os.getenv("REPORT_FACTS_MB", config.get("report_facts_mb", 32)))
+ANALYTICS_ENABLED = os.getenv("ANALYTICS_ENABLED", str(config.get("analytics_enabled", True))).lower() == "true"
+STATS_COLLECTION = os.getenv("STATS_COLLECTION", config.get("stats_collection", "test-case-stats"))
+STATS_WINDOW = int(os.getenv("STATS_WINDOW", config.get("stats_window", 200)))
+STATS_MA_WINDOW = int(os.getenv("STATS_MA_WINDOW", config.get("stats_ma_window", 5)))
+STATS_MIN_SAMPLES = int(os.getenv("STATS_MIN_SAMPLES", config.get("stats_min_samples", 10)))
+STATS_REGRESSION_FACTOR = float(os.getenv("STATS_REGRESSION_FACTOR", config.get("stats_regression_factor", 1.5)))
+STATS_BATCH_RUNS = int(os.getenv("STATS_BATCH_RUNS", config.get("stats_batch_runs", 200)))
+CHECKPOINT_COLLECTION = os.getenv("CHECKPOINT_COLLECTION", config.get("checkpoint_collection", "job-checkpoints"))
 
 # MongoDB
 client = MongoClient(MONGO_URI)
 db = client[DB_NAME]
 
+_outbox = None
+
 def log_watcher(level, message):
     print(f"[{level}] {message}")
     try:
-        db["log-watcher"].insert_one({
+        doc = {
             "level": level,
             "message": message,
             "timestamp": datetime.now()
-        })
+        }
+        if _outbox:
+            _outbox.put("log-watcher", "insert_one", {"document": doc})
+        else:
+            db["log-watcher"].insert_one(doc)
     except Exception as e:
         print(f"[ERROR] Log to DB failed: {e}")
 
@@ -62,13 +132,354 @@ log_watcher("CONFIG", f"Using file: {_cfg_file}")
 def _utc_now():
     return datetime.utcnow()
 
-def _read_json(fp):
+def _estimate_size(obj):
+    """Approximate in-memory size of a decoded JSON value."""
+    total = 0
+    stack = [obj]
+    while stack:
+        o = stack.pop()
+        total += sys.getsizeof(o)
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple)):
+            stack.extend(o)
+    return total
+
+class ReportCache:
+    """Values derived from report files keyed by (path, mtime, size), evicted LRU by estimated memory size."""
+
+    def __init__(self, max_bytes, sizer=_estimate_size):
+        self.max_bytes = max_bytes
+        self.sizer = sizer
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, sig, loader):
+        with self.lock:
+            hit = self.entries.get(key)
+            if hit and hit[0] == sig:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return hit[1]
+            self.misses += 1
+        value = loader()
+        cost = max(self.sizer(value), 64)
+        if cost > self.max_bytes // 4:
+            return value
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old:
+                self.bytes -= old[2]
+            self.entries[key] = (sig, value, cost)
+            self.bytes += cost
+            while self.bytes > self.max_bytes and self.entries:
+                _, ev = self.entries.popitem(last=False)
+                self.bytes -= ev[2]
+                self.evictions += 1
+        return value
+
+    def peek(self, key, sig):
+        with self.lock:
+            hit = self.entries.get(key)
+            return bool(hit and hit[0] == sig)
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hitRate": round(self.hits / total, 3) if total else 0
+            }
+
+def _decode_json(fp):
     try:
         with open(fp) as fh:
             return json.load(fh)
     except Exception:
         return None
 
+def _decode_bytes(raw):
+    try:
+        return json.loads(raw.decode("utf-8-sig"))
+    except Exception:
+        return None
+
+_report_cache = ReportCache(REPORT_CACHE_MB * 1024 * 1024) if REPORT_CACHE_MB > 0 else None
+_facts_cache = ReportCache(REPORT_FACTS_MB * 1024 * 1024) if REPORT_FACTS_MB > 0 else None
+
+NON_OUTCOME_FILES = {
+    "serenity.configuration.json",
+    "bootstrap-icons.json",
+    "serenity-summary.json",
+    "manifest.json",
+    "package.json",
+}
+SNIFF_HEAD_BYTES = 8192
+SNIFF_CHUNK_BYTES = 1024 * 1024
+SNIFF_MARKERS = (b'"testSteps"', b'"result"')
+
+def _sniff_stream(read):
+    """Reject only a non-object file or one that names neither key anywhere; usually decided by the head."""
+    head = read(SNIFF_HEAD_BYTES)
+    if not head.lstrip(b"\xef\xbb\xbf \t\r\n").startswith(b"{"):
+        return False
+    if any(m in head for m in SNIFF_MARKERS):
+        return True
+    keep = max(len(m) for m in SNIFF_MARKERS) - 1
+    tail = head[-keep:]
+    while True:
+        chunk = read(SNIFF_CHUNK_BYTES)
+        if not chunk:
+            return False
+        buf = tail + chunk
+        if any(m in buf for m in SNIFF_MARKERS):
+            return True
+        tail = buf[-keep:]
+
+def _sniff_bytes(raw):
+    return _sniff_stream(io.BytesIO(raw).read)
+
+def _sniff_outcome(fp):
+    with open(fp, "rb") as fh:
+        return _sniff_stream(fh.read)
+
+_outcome_decisions = OrderedDict()
+_outcome_lock = threading.Lock()
+_outcome_stats = {"sniffed": 0, "accepted": 0, "rejected": 0}
+
+def _is_json_name(name):
+    return name.lower().endswith(".json") and name not in NON_OUTCOME_FILES
+
+def _known_decision(key, sig):
+    with _outcome_lock:
+        hit = _outcome_decisions.get(key)
+        if hit and hit[0] == sig:
+            _outcome_decisions.move_to_end(key)
+            return hit[1]
+    return None
+
+def _remember_decision(key, sig, ok):
+    with _outcome_lock:
+        _outcome_decisions[key] = (sig, ok)
+        if len(_outcome_decisions) > 100000:
+            _outcome_decisions.popitem(last=False)
+        _outcome_stats["sniffed"] += 1
+        _outcome_stats["accepted" if ok else "rejected"] += 1
+
+def _is_outcome_file(fp):
+    if not _is_json_name(os.path.basename(fp)):
+        return False
+    try:
+        st = os.stat(fp)
+    except OSError:
+        return False
+    sig = (st.st_mtime_ns, st.st_size)
+    known = _known_decision(fp, sig)
+    if known is not None:
+        return known
+    try:
+        ok = _sniff_outcome(fp)
+    except Exception:
+        return False
+    _remember_decision(fp, sig, ok)
+    return ok
+
+ARCHIVE_SUFFIXES = (".zip", ".tar.gz", ".tgz")
+
+def _has_archive_suffix(path):
+    return isinstance(path, str) and path.lower().endswith(ARCHIVE_SUFFIXES)
+
+def _is_run_archive(path):
+    return _has_archive_suffix(path) and os.path.isfile(path)
+
+def _is_run_source(path):
+    return os.path.isdir(path) or _is_run_archive(path)
+
+def _run_id_for(path):
+    name = os.path.basename(path)
+    for suf in ARCHIVE_SUFFIXES:
+        if name.lower().endswith(suf):
+            return name[:-len(suf)]
+    return name
+
+def _iter_archive_members(path):
+    if path.lower().endswith(".zip"):
+        with zipfile.ZipFile(path) as zf:
+            for info in zf.infolist():
+                if not info.is_dir():
+                    yield info.filename, info.file_size, (lambda i=info: zf.read(i))
+    else:
+        with tarfile.open(path, "r|gz") as tf:
+            for m in tf:
+                if m.isfile():
+                    yield m.name, m.size, (lambda m=m: tf.extractfile(m).read())
+
+def _archive_complete(path):
+    """True once the archive is fully written: zip central directory present, or gzip stream ends cleanly."""
+    try:
+        if path.lower().endswith(".zip"):
+            with zipfile.ZipFile(path):
+                return True
+        with gzip.open(path, "rb") as fh:
+            while fh.read(1024 * 1024):
+                pass
+        return True
+    except (zipfile.BadZipFile, OSError, EOFError):
+        return False
+
+def _read_archive_member(path, member):
+    if path.lower().endswith(".zip"):
+        with zipfile.ZipFile(path) as zf:
+            return zf.read(member)
+    with tarfile.open(path, "r:gz") as tf:
+        return tf.extractfile(member).read()
+
+# archive path -> ((mtime_ns, size), [(key, name, sig, member)]) of the accepted reports
+_archive_index = OrderedDict()
+_archive_lock = threading.Lock()
+
+def _iter_archive_sources(path, cache=None):
+    try:
+        st = os.stat(path)
+    except OSError as e:
+        log_watcher("WARN", f"Cannot read archive {path}: {e}")
+        return
+    asig = (st.st_mtime_ns, st.st_size)
+    with _archive_lock:
+        hit = _archive_index.get(path)
+        if hit and hit[0] == asig:
+            _archive_index.move_to_end(path)
+    if hit and hit[0] == asig and cache and all(cache.peek(key, sig) for key, _, sig, _ in hit[1]):
+        # Nothing changed and every report is cached: do not open (or gunzip) the archive at all.
+        for key, name, sig, member in hit[1]:
+            yield key, name, sig, (lambda member=member: _decode_bytes(_read_archive_member(path, member)))
+        return
+    entries = []
+    try:
+        mtime = st.st_mtime_ns
+        for member, size, read in _iter_archive_members(path):
+            name = os.path.basename(member)
+            if not _is_json_name(name):
+                continue
+            key = f"{path}!{member}"
+            sig = (mtime, size)
+            raw = None
+            ok = _known_decision(key, sig)
+            if ok is None:
+                raw = read()
+                ok = _sniff_bytes(raw)
+                _remember_decision(key, sig, ok)
+            if not ok:
+                continue
+            entries.append((key, name, sig, member))
+            yield key, name, sig, (lambda raw=raw, read=read: _decode_bytes(raw if raw is not None else read()))
+    except (zipfile.BadZipFile, tarfile.TarError, OSError, EOFError) as e:
+        log_watcher("WARN", f"Cannot read archive {path}: {e}")
+        return
+    with _archive_lock:
+        _archive_index[path] = (asig, entries)
+        _archive_index.move_to_end(path)
+        if len(_archive_index) > 10000:
+            _archive_index.popitem(last=False)
+
+def _iter_report_sources(root, cache=None):
+    """Yield (key, name, sig, loader) for every outcome report under a run folder, base path or archive."""
+    if _is_run_archive(root):
+        yield from _iter_archive_sources(root, cache)
+        return
+    for dirpath, dirs, files in os.walk(root):
+        for f in files:
+            fp = os.path.join(dirpath, f)
+            if _is_run_archive(fp):
+                yield from _iter_archive_sources(fp, cache)
+            elif _is_outcome_file(fp):
+                try:
+                    st = os.stat(fp)
+                except OSError:
+                    continue
+                yield fp, f, (st.st_mtime_ns, st.st_size), (lambda fp=fp: _decode_json(fp))
+
+def _iter_reports(root):
+    for key, name, sig, loader in _iter_report_sources(root, _report_cache):
+        yield key, name, _report_cache.get(key, sig, loader) if _report_cache else loader()
+
+def _scan_causes(obj, out):
+    """Collect (causes, testCaseName) for nested results whose upper-cased status is a key of out."""
+    try:
+        if isinstance(obj, dict):
+            r = obj.get('result')
+            if isinstance(r, str) and r.upper() in out:
+                causes = obj.get('testFailureCause')
+                tc = obj.get('testCaseName') or obj.get('title') or obj.get('name')
+                use = []
+                if isinstance(causes, list):
+                    use = [str(x) for x in causes if x]
+                elif isinstance(causes, str):
+                    use = [causes]
+                elif isinstance(causes, dict):
+                    et = causes.get('errorType')
+                    msg = causes.get('message')
+                    val = et or (msg[:200] if isinstance(msg, str) else None)
+                    if val:
+                        use = [str(val)]
+                if use:
+                    out[r.upper()].append((use, tc))
+            for v in obj.values():
+                _scan_causes(v, out)
+        elif isinstance(obj, list):
+            for v in obj:
+                _scan_causes(v, out)
+    except Exception:
+        pass
+    return out
+
+def _report_facts(data):
+    r = data.get('result') if isinstance(data, dict) else None
+    causes = _scan_causes(data, {"ERROR": [], "FAILURE": []})
+    return {"result": str(r).upper() if r else None, "error": causes["ERROR"], "fail": causes["FAILURE"]}
+
+def _iter_report_facts(root):
+    """Like _iter_reports but yields the compact facts the summary scanners need, cached separately."""
+    for key, name, sig, loader in _iter_report_sources(root, _facts_cache):
+        # Decode through the report cache so the ingest loop that follows reuses the same parse.
+        load = lambda key=key, sig=sig, loader=loader: _report_facts(_report_cache.get(key, sig, loader) if _report_cache else loader())
+        yield key, name, _facts_cache.get(key, sig, load) if _facts_cache else load()
+
+_archive_texts = OrderedDict()
+
+def _read_archive_text(path, name):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    asig = (st.st_mtime_ns, st.st_size)
+    with _archive_lock:
+        hit = _archive_texts.get((path, name))
+        if hit and hit[0] == asig:
+            return hit[1]
+    best = None
+    try:
+        for member, size, read in _iter_archive_members(path):
+            if os.path.basename(member) == name and (best is None or member.count("/") < best[0]):
+                best = (member.count("/"), read().decode("utf-8", "replace"))
+    except (zipfile.BadZipFile, tarfile.TarError, OSError, EOFError):
+        return None
+    text = best[1] if best else None
+    with _archive_lock:
+        _archive_texts[(path, name)] = (asig, text)
+        if len(_archive_texts) > 10000:
+            _archive_texts.popitem(last=False)
+    return text
+
 def _read_properties(fp):
     result = {}
     try:
@@ -98,7 +509,12 @@ def _folder_start_time(folder_path):
 
 def _parse_summary_txt(folder_path):
     fp = os.path.join(folder_path, "summary.txt")
-    if not os.path.isfile(fp):
+    text = None
+    if _is_run_archive(folder_path):
+        text = _read_archive_text(folder_path, "summary.txt")
+        if text is None:
+            return None
+    elif not os.path.isfile(fp):
         return None
     result = {
         "start_time_str": None,
@@ -112,8 +528,9 @@ def _parse_summary_txt(folder_path):
         "compromised": None
     }
     try:
-        with open(fp, encoding="utf-8") as fh:
-            text = fh.read()
+        if text is None:
+            with open(fp, encoding="utf-8") as fh:
+                text = fh.read()
         m = re.search(r"Serenity report generated\s+(\d{2}-\d{2}-\d{4}\s+\d{2}:\d{2}:\d{2})", text)
         if m:
             result["start_time_str"] = m.group(1)
@@ -148,6 +565,22 @@ def _extract_start_time_from_name(name):
         pass
     return None
 
+def _parse_start_time(s):
+    if not isinstance(s, str) or not s:
+        return None
+    for fmt in ("%Y-%m-%d %H-%M", "%d-%m-%Y %H:%M:%S", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(s.strip(), fmt)
+        except ValueError:
+            pass
+    return None
+
+def _run_start_datetime(folder_path):
+    dt = _parse_start_time(_extract_start_time_from_name(_run_id_for(folder_path)))
+    if dt:
+        return dt
+    return _folder_start_time(folder_path)
+
 def _mask_headers(h):
     if not isinstance(h, dict):
         return None
@@ -235,6 +668,130 @@ def _extract_req_res(step):
             }
     return req, res
 
+# hash -> monotonic time lastSeenAt was last bumped; must stay well below BLOB_SWEEP_GRACE_HOURS
+_known_blobs = {}
+KNOWN_BLOB_TTL_SECONDS = 3600
+
+def _store_blob(text):
+    raw = text.encode("utf-8")
+    h = hashlib.sha256(raw).hexdigest()
+    ref = {"blobRef": h, "size": len(raw)}
+    seen = _known_blobs.get(h)
+    if seen and time.monotonic() - seen < KNOWN_BLOB_TTL_SECONDS:
+        return ref
+    try:
+        _write_one(
+            db[BLOB_COLLECTION],
+            {"_id": h},
+            {"$setOnInsert": {
+                "encoding": "zlib",
+                "size": len(raw),
+                "data": zlib.compress(raw, 6),
+                "createdAt": _utc_now()
+            }, "$set": {"lastSeenAt": _utc_now()}},
+            upsert=True
+        )
+    except Exception as e:
+        log_watcher("ERROR", f"Store blob failed: {e}")
+        return None
+    if len(_known_blobs) >= 100000:
+        _known_blobs.clear()
+    _known_blobs[h] = time.monotonic()
+    return ref
+
+def _offload_large(d, keys):
+    if not isinstance(d, dict) or BLOB_THRESHOLD_BYTES <= 0:
+        return d
+    for k in keys:
+        v = d.get(k)
+        if isinstance(v, str) and len(v) >= BLOB_THRESHOLD_BYTES // 4 and len(v.encode("utf-8")) >= BLOB_THRESHOLD_BYTES:
+            ref = _store_blob(v)
+            if ref:
+                d[k] = ref
+    return d
+
+BLOB_REF_FIELDS = ("request.content.blobRef", "request.responseBody.blobRef", "response.body.blobRef")
+_blob_sweep_after = None
+
+def sweep_blobs(batch=BLOB_SWEEP_BATCH, grace_hours=BLOB_SWEEP_GRACE_HOURS):
+    """Mark-and-sweep one page of blobs: delete those no test step references and nobody stored recently."""
+    global _blob_sweep_after
+    cutoff = _utc_now() - timedelta(hours=grace_hours)
+    stale = {"$or": [
+        {"lastSeenAt": {"$lt": cutoff}},
+        {"lastSeenAt": {"$exists": False}, "createdAt": {"$lt": cutoff}}
+    ]}
+    filt = dict(stale)
+    if _blob_sweep_after is not None:
+        filt = {"$and": [stale, {"_id": {"$gt": _blob_sweep_after}}]}
+    try:
+        ids = [d["_id"] for d in db[BLOB_COLLECTION].find(filt, {"_id": 1}).sort("_id", ASCENDING).limit(batch)]
+        if len(ids) < batch:
+            _blob_sweep_after = None
+        else:
+            _blob_sweep_after = ids[-1]
+        if not ids:
+            return 0
+        used = set()
+        cur = db["test-steps"].find(
+            {"$or": [{path: {"$in": ids}} for path in BLOB_REF_FIELDS]},
+            {path: 1 for path in BLOB_REF_FIELDS}
+        )
+        for step in cur:
+            for part, key in (("request", "content"), ("request", "responseBody"), ("response", "body")):
+                v = (step.get(part) or {}).get(key)
+                if isinstance(v, dict) and v.get("blobRef"):
+                    used.add(v["blobRef"])
+        unused = [h for h in ids if h not in used]
+        if unused:
+            _db_write(db[BLOB_COLLECTION], "delete_many", {"filter": {"$and": [stale, {"_id": {"$in": unused}}]}})
+            for h in unused:
+                _known_blobs.pop(h, None)
+            log_watcher("RETENTION", f"Swept {len(unused)} unreferenced blob(s)")
+        return len(unused)
+    except Exception as e:
+        log_watcher("ERROR", f"Blob sweep failed: {e}")
+        return 0
+
+def load_blob(ref):
+    if not (isinstance(ref, dict) and ref.get("blobRef")):
+        return ref
+    try:
+        doc = db[BLOB_COLLECTION].find_one({"_id": ref["blobRef"]})
+        if not doc:
+            return None
+        raw = doc.get("data")
+        if doc.get("encoding") == "zlib":
+            raw = zlib.decompress(raw)
+        return raw.decode("utf-8")
+    except Exception as e:
+        log_watcher("ERROR", f"Load blob failed: {e}")
+        return None
+
+def _offload_request(req):
+    if not isinstance(req, dict):
+        return req
+    content = req.get("content")
+    _offload_large(req, ("content", "responseBody"))
+    ref = req.get("content")
+    curl = req.get("cUrl")
+    if isinstance(ref, dict) and ref.get("blobRef") and isinstance(curl, str):
+        req["cUrl"] = curl.replace(f"--data '{content}'", f"--data @blob:{ref['blobRef']}")
+    return req
+
+def resolve_step_payloads(step_doc):
+    if not isinstance(step_doc, dict):
+        return step_doc
+    for part in ("request", "response"):
+        d = step_doc.get(part)
+        if isinstance(d, dict):
+            for k, v in list(d.items()):
+                if isinstance(v, dict) and v.get("blobRef"):
+                    d[k] = load_blob(v)
+                    if part == "request" and k == "content" and isinstance(d.get("cUrl"), str) and isinstance(d[k], str):
+                        d["cUrl"] = d["cUrl"].replace(f"--data @blob:{v['blobRef']}", f"--data '{d[k]}'")
+    return step_doc
+
 def _flatten_steps(steps):
     flat = []
     def walk(arr):
@@ -258,12 +815,463 @@ def _compute_case_duration(d):
             total += int(sd)
     return total
 
+class RateLimiter:
+    def __init__(self, max_ops=0, max_mb=0):
+        self.op_interval = 1.0 / max_ops if max_ops and max_ops > 0 else 0
+        self.byte_interval = 1.0 / (max_mb * 1024 * 1024) if max_mb and max_mb > 0 else 0
+        self.next_at = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self, nbytes=0):
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_at)
+            self.next_at = start + self.op_interval + nbytes * self.byte_interval
+            wait = start - now
+        if wait > 0:
+            time.sleep(wait)
+
+_write_limiter = None
+
+def set_write_limit(max_ops=0, max_mb=0):
+    global _write_limiter
+    if (max_ops and max_ops > 0) or (max_mb and max_mb > 0):
+        _write_limiter = RateLimiter(max_ops, max_mb)
+        log_watcher("CONFIG", f"Write limit: ops/s={max_ops or '-'}, MB/s={max_mb or '-'}")
+    else:
+        _write_limiter = None
+
+def _doc_size(doc):
+    try:
+        return len(bson_encode(doc))
+    except Exception:
+        return 0
+
+class QueryCache:
+    """LRU + TTL cache whose entries carry tags; writes invalidate by tag."""
+
+    def __init__(self, max_entries=1024, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.tag_keys = {}
+        self.tag_gen = {}
+        self.gen = 0
+        self.floor = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get_or_load(self, key, tags, loader):
+        now = time.monotonic()
+        with self.lock:
+            hit = self.entries.get(key)
+            if hit and hit[0] > now:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return hit[1]
+            self.misses += 1
+            start = self.gen
+        value = loader()
+        with self.lock:
+            if start < self.floor or any(self.tag_gen.get(t, 0) > start for t in tags):
+                return value
+            self._drop(key)
+            self.entries[key] = (now + self.ttl, value, tags)
+            for t in tags:
+                self.tag_keys.setdefault(t, set()).add(key)
+            while len(self.entries) > self.max_entries:
+                self._drop(next(iter(self.entries)))
+        return value
+
+    def _drop(self, key):
+        old = self.entries.pop(key, None)
+        if old:
+            for t in old[2]:
+                keys = self.tag_keys.get(t)
+                if keys:
+                    keys.discard(key)
+                    if not keys:
+                        del self.tag_keys[t]
+
+    def invalidate(self, tags):
+        with self.lock:
+            self.gen += 1
+            if len(self.tag_gen) > 10000:
+                self.tag_gen.clear()
+                self.floor = self.gen
+            for t in tags:
+                self.tag_gen[t] = self.gen
+                for key in list(self.tag_keys.get(t, ())):
+                    self._drop(key)
+
+    def stats(self):
+        with self.lock:
+            return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+_query_cache = None
+
+def _notify_write(coll_name, args):
+    if _query_cache is None:
+        return
+    tags = [coll_name]
+    f = args.get("filter") if isinstance(args, dict) else None
+    if isinstance(f, dict) and isinstance(f.get("runId"), str):
+        tags.append(f"{coll_name}:{f['runId']}")
+    _query_cache.invalidate(tags)
+
+def _db_write(coll, op, args):
+    if _outbox:
+        _outbox.put(coll.name, op, args)
+        return None
+    if _write_limiter:
+        _write_limiter.acquire(_doc_size(args) if _write_limiter.byte_interval else 0)
+    res = getattr(coll, op)(**args)
+    _notify_write(coll.name, args)
+    return res
+
+def _write_one(coll, filt, update, upsert=True):
+    return _db_write(coll, "update_one", {"filter": filt, "update": update, "upsert": upsert})
+
+def _is_retryable(exc):
+    if isinstance(exc, (ConnectionFailure, ExecutionTimeout, WTimeoutError)):
+        return True
+    return isinstance(exc, PyMongoError) and exc.has_error_label("RetryableWriteError")
+
+def _outbox_request(rec):
+    a = rec.get("a") or {}
+    o = rec.get("o")
+    if o == "update_one":
+        return UpdateOne(a["filter"], a["update"], upsert=a.get("upsert", False))
+    if o == "update_many":
+        return UpdateMany(a["filter"], a["update"], upsert=a.get("upsert", False))
+    if o == "insert_one":
+        return InsertOne(a["document"])
+    if o == "delete_one":
+        return DeleteOne(a["filter"])
+    if o == "delete_many":
+        return DeleteMany(a["filter"])
+    raise ValueError(f"unknown outbox op: {o}")
+
+class Outbox:
+    """Append-only segment files under `directory`; a flusher thread replays them in order with bulk_write."""
+
+    def __init__(self, directory, max_bytes, batch_size=500, segment_bytes=8 * 1024 * 1024):
+        self.dir = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = max(64 * 1024, min(segment_bytes, max_bytes // 4))
+        self.batch_size = batch_size
+        self.cond = threading.Condition()
+        self.stopping = False
+        self.applied = 0
+        self.failures = 0
+        self.dropped = 0
+        self.head_ts = None
+        os.makedirs(directory, exist_ok=True)
+        self.lock_fh = self._lock_dir()
+        self.dead_path = os.path.join(directory, "dead-letter.log")
+        segs = self._segments()
+        self.disk_bytes = sum(os.path.getsize(self._seg_path(n)) for n in segs)
+        self.write_seq = (segs[-1] + 1) if segs else 1
+        self.cursor = self._load_cursor(segs)
+        self.writer = open(self._seg_path(self.write_seq), "ab")
+        self.thread = threading.Thread(target=self._run, name="outbox-flusher", daemon=True)
+
+    def _lock_dir(self):
+        fh = open(os.path.join(self.dir, "lock"), "a+")
+        try:
+            if msvcrt:
+                fh.seek(0)
+                msvcrt.locking(fh.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            fh.close()
+            raise RuntimeError(f"outbox directory {os.path.abspath(self.dir)} is in use by another process")
+        return fh
+
+    def _unlock_dir(self):
+        try:
+            if msvcrt:
+                self.lock_fh.seek(0)
+                msvcrt.locking(self.lock_fh.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(self.lock_fh.fileno(), fcntl.LOCK_UN)
+        except OSError:
+            pass
+        self.lock_fh.close()
+
+    def _seg_path(self, n):
+        return os.path.join(self.dir, f"{n:012d}.log")
+
+    def _segments(self):
+        out = []
+        for f in os.listdir(self.dir):
+            if f.endswith(".log") and f[:-4].isdigit():
+                out.append(int(f[:-4]))
+        return sorted(out)
+
+    def _load_cursor(self, segs):
+        seg, off = 0, 0
+        try:
+            with open(os.path.join(self.dir, "cursor.json")) as fh:
+                c = json.load(fh)
+            seg, off = int(c.get("segment", 0)), int(c.get("offset", 0))
+        except Exception:
+            pass
+        if seg not in segs:
+            later = [n for n in segs if n > seg]
+            seg, off = (later[0] if later else self.write_seq), 0
+        return (seg, off)
+
+    def _save_cursor(self):
+        tmp = os.path.join(self.dir, "cursor.json.tmp")
+        with open(tmp, "w") as fh:
+            json.dump({"segment": self.cursor[0], "offset": self.cursor[1]}, fh)
+            if OUTBOX_FSYNC:
+                fh.flush()
+                os.fsync(fh.fileno())
+        os.replace(tmp, os.path.join(self.dir, "cursor.json"))
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def put(self, coll_name, op, args):
+        rec = {"c": coll_name, "o": op, "a": args, "ts": time.time()}
+        line = (json_util.dumps(rec, json_options=json_util.RELAXED_JSON_OPTIONS) + "\n").encode("utf-8")
+        with self.cond:
+            warned = False
+            while self.disk_bytes + len(line) > self.max_bytes and not self.stopping:
+                if not warned:
+                    print(f"[WARN] Outbox full ({self.disk_bytes} bytes), waiting for flusher")
+                    warned = True
+                self.cond.wait(1)
+            if self.writer.tell() >= self.segment_bytes:
+                self._rotate()
+            self.writer.write(line)
+            self.writer.flush()
+            if OUTBOX_FSYNC:
+                os.fsync(self.writer.fileno())
+            self.disk_bytes += len(line)
+            self.cond.notify_all()
+
+    def _rotate(self):
+        self.writer.close()
+        self.write_seq += 1
+        self.writer = open(self._seg_path(self.write_seq), "ab")
+
+    def _caught_up(self):
+        return self.cursor[0] == self.write_seq and self.cursor[1] >= self.writer.tell()
+
+    def _read_batch(self):
+        seg, off = self.cursor
+        with self.cond:
+            active = seg == self.write_seq
+        batch = []
+        try:
+            with open(self._seg_path(seg), "rb") as fh:
+                fh.seek(off)
+                while len(batch) < self.batch_size:
+                    line = fh.readline()
+                    if not line or not line.endswith(b"\n"):
+                        break
+                    off += len(line)
+                    try:
+                        rec = json_util.loads(line.decode("utf-8"), json_options=json_util.RELAXED_JSON_OPTIONS)
+                        batch.append((rec, _outbox_request(rec), line))
+                    except Exception as e:
+                        self._dead_letter(line, f"bad record in segment {seg}: {e}")
+        except FileNotFoundError:
+            pass
+        seg_done = not active and len(batch) < self.batch_size
+        return batch, off, seg_done
+
+    def _finish_segment(self):
+        seg = self.cursor[0]
+        p = self._seg_path(seg)
+        with self.cond:
+            try:
+                size = os.path.getsize(p)
+                os.remove(p)
+                self.disk_bytes -= size
+            except FileNotFoundError:
+                pass
+            later = [n for n in self._segments() if n > seg]
+            self.cursor = (later[0] if later else self.write_seq, 0)
+            self._save_cursor()
+            self.cond.notify_all()
+
+    def _dead_letter(self, line, reason):
+        self.dropped += 1
+        print(f"[ERROR] Outbox dropped write: {reason}")
+        try:
+            if os.path.exists(self.dead_path) and os.path.getsize(self.dead_path) + len(line) > OUTBOX_DEAD_LETTER_MB * 1024 * 1024:
+                return
+            with open(self.dead_path, "ab") as fh:
+                fh.write(line)
+        except OSError as e:
+            print(f"[ERROR] Outbox dead-letter write failed: {e}")
+
+    def _bulk(self, name, items):
+        reqs = [it[1] for it in items]
+        k = 0
+        while k < len(reqs):
+            try:
+                db[name].bulk_write(reqs[k:], ordered=True)
+                return
+            except BulkWriteError as e:
+                errs = e.details.get("writeErrors") or []
+                if not errs:
+                    raise
+                idx = errs[0].get("index", 0)
+                self._dead_letter(items[k + idx][2], f"{name}: {errs[0].get('errmsg')}")
+                k += idx + 1
+            except Exception as e:
+                if _is_retryable(e):
+                    raise
+                for j in range(k, len(reqs)):
+                    try:
+                        db[name].bulk_write([reqs[j]], ordered=True)
+                    except Exception as e2:
+                        if _is_retryable(e2):
+                            raise
+                        self._dead_letter(items[j][2], f"{name}: {e2}")
+                return
+
+    def _apply(self, batch):
+        i = 0
+        while i < len(batch):
+            name = batch[i][0]["c"]
+            start = i
+            while i < len(batch) and batch[i][0]["c"] == name:
+                if _write_limiter:
+                    _write_limiter.acquire(len(batch[i][2]) if _write_limiter.byte_interval else 0)
+                i += 1
+            self._bulk(name, batch[start:i])
+            for rec, _, _ in batch[start:i]:
+                _notify_write(name, rec.get("a"))
+
+    def _run(self):
+        delay = 0
+        while True:
+            with self.cond:
+                if self.stopping:
+                    return
+            batch, end_off, seg_done = self._read_batch()
+            if batch:
+                self.head_ts = batch[0][0].get("ts")
+                try:
+                    self._apply(batch)
+                except Exception as e:
+                    self.failures += 1
+                    delay = min(OUTBOX_MAX_BACKOFF_SECONDS, delay * 2 if delay else 0.5)
+                    print(f"[WARN] Outbox flush failed, retry in {delay}s: {e}")
+                    # put() notifies the same condition, so wait out the full delay explicitly.
+                    retry_at = time.monotonic() + delay
+                    with self.cond:
+                        while not self.stopping and time.monotonic() < retry_at:
+                            self.cond.wait(retry_at - time.monotonic())
+                    continue
+                delay = 0
+                self.applied += len(batch)
+                with self.cond:
+                    self.cursor = (self.cursor[0], end_off)
+                    self._save_cursor()
+                    self.cond.notify_all()
+            if seg_done:
+                self._finish_segment()
+                continue
+            if not batch:
+                with self.cond:
+                    self.head_ts = None
+                    if self._caught_up() and self.cursor[1] >= self.segment_bytes // 4:
+                        self._rotate()
+                        continue
+                    self.cond.wait(0.5)
+
+    def stats(self):
+        with self.cond:
+            pending = self.disk_bytes - self.cursor[1]
+            segments = self.write_seq - self.cursor[0] + 1
+        lag = time.time() - self.head_ts if self.head_ts else 0
+        return {
+            "pendingBytes": max(0, pending),
+            "segments": segments,
+            "lagSeconds": round(lag, 1),
+            "applied": self.applied,
+            "failures": self.failures,
+            "dropped": self.dropped,
+            "deadLetterBytes": os.path.getsize(self.dead_path) if os.path.exists(self.dead_path) else 0
+        }
+
+    def drain(self, timeout=None):
+        deadline = time.time() + timeout if timeout else None
+        with self.cond:
+            while not self._caught_up():
+                if deadline and time.time() >= deadline:
+                    return False
+                self.cond.wait(0.5)
+        return True
+
+    def stop(self, drain_timeout=10):
+        self.drain(drain_timeout)
+        with self.cond:
+            self.stopping = True
+            self.cond.notify_all()
+        self.thread.join(5)
+        with self.cond:
+            self.writer.close()
+        self._unlock_dir()
+
+def start_outbox():
+    global _outbox
+    if not OUTBOX_ENABLED or _outbox:
+        return _outbox
+    try:
+        _outbox = Outbox(OUTBOX_DIR, OUTBOX_MAX_MB * 1024 * 1024, OUTBOX_BATCH_SIZE).start()
+        log_watcher("CONFIG", f"Outbox: {os.path.abspath(OUTBOX_DIR)} (max {OUTBOX_MAX_MB} MB)")
+    except Exception as e:
+        log_watcher("WARN", f"Outbox disabled, writing directly: {e}")
+    return _outbox
+
+def stop_outbox():
+    global _outbox
+    if _outbox:
+        ob = _outbox
+        _outbox = None
+        ob.stop()
+        st = ob.stats()
+        if st["pendingBytes"]:
+            print(f"[OUTBOX] {st['pendingBytes']} bytes left on disk, replayed on next start")
+
+def log_cache_stats():
+    if _report_cache:
+        st = _report_cache.stats()
+        log_watcher("CACHE", f"reports entries={st['entries']} bytes={st['bytes']} hits={st['hits']} misses={st['misses']} evictions={st['evictions']}")
+    if _facts_cache:
+        st = _facts_cache.stats()
+        log_watcher("CACHE", f"facts entries={st['entries']} bytes={st['bytes']} hits={st['hits']} misses={st['misses']} evictions={st['evictions']}")
+    log_watcher("CACHE", f"classifier sniffed={_outcome_stats['sniffed']} accepted={_outcome_stats['accepted']} rejected={_outcome_stats['rejected']}")
+
+def log_outbox_stats():
+    if _outbox:
+        st = _outbox.stats()
+        if st["pendingBytes"] or st["lagSeconds"]:
+            log_watcher("OUTBOX", f"pending={st['pendingBytes']}B segments={st['segments']} lag={st['lagSeconds']}s applied={st['applied']} failures={st['failures']}")
+
 def ensure_run_indexes(db):
     try:
         db["test-runs"].create_index([("runId", ASCENDING)], unique=True)
         db["test-cases"].create_index([("runId", ASCENDING), ("testCaseId", ASCENDING)], unique=True)
         db["test-steps"].create_index([("runId", ASCENDING), ("testCaseId", ASCENDING), ("stepOrder", ASCENDING)], unique=True)
         db["attachments"].create_index([("runId", ASCENDING), ("testCaseId", ASCENDING), ("name", ASCENDING), ("path", ASCENDING)], unique=False)
+        db["test-runs"].create_index([("project", ASCENDING), ("startTime", ASCENDING)])
+        db[ARCHIVE_COLLECTION].create_index([("runId", ASCENDING)], unique=True)
+        db[STATS_COLLECTION].create_index([("project", ASCENDING), ("testCaseId", ASCENDING)], unique=True)
+        db[CHECKPOINT_COLLECTION].create_index([("job", ASCENDING), ("key", ASCENDING)])
+        for path in BLOB_REF_FIELDS:
+            db["test-steps"].create_index([(path, ASCENDING)], sparse=True)
     except Exception as e:
         log_watcher("WARN", f"Create run indexes failed: {e}")
 
@@ -277,6 +1285,179 @@ def folder_size(path):
     return total
 
 
+class LeaseManager:
+    """Expiring, renewable leases stored as {_id: name, owner, expiresAt} documents."""
+
+    def __init__(self, coll, owner, ttl=60):
+        self.coll = coll
+        self.owner = owner
+        self.ttl = ttl
+        self.held = {}
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.unavailable_until = 0
+        self.clock_offset = None
+        self.clock_checked = 0
+
+    def _down(self):
+        return time.monotonic() < self.unavailable_until
+
+    def _mark_down(self, e):
+        if isinstance(e, ConnectionFailure):
+            self.unavailable_until = time.monotonic() + self.ttl / 3
+
+    def ensure_indexes(self):
+        try:
+            self.coll.create_index([("expiresAt", ASCENDING)], expireAfterSeconds=3600)
+        except Exception as e:
+            log_watcher("WARN", f"Create lease index failed: {e}")
+
+    def _server_now(self):
+        """Server clock time (offset refreshed every ttl/3) so host clock skew cannot yield two owners."""
+        if self.clock_offset is None or time.monotonic() - self.clock_checked > self.ttl / 3:
+            t0 = _utc_now()
+            try:
+                server = self.coll.database.command("hello")["localTime"]
+            except OperationFailure:
+                server = self.coll.database.command("isMaster")["localTime"]
+            t1 = _utc_now()
+            self.clock_offset = server.replace(tzinfo=None) - (t0 + (t1 - t0) / 2)
+            self.clock_checked = time.monotonic()
+        return _utc_now() + self.clock_offset
+
+    def acquire(self, name, ttl=None):
+        if self._down():
+            return False
+        try:
+            now = self._server_now()
+            self.coll.find_one_and_update(
+                {"_id": name, "done": {"$ne": True}, "$or": [{"owner": self.owner}, {"expiresAt": {"$lt": now}}]},
+                {"$set": {"owner": self.owner, "expiresAt": now + timedelta(seconds=ttl or self.ttl), "renewedAt": now}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            return False
+        except Exception as e:
+            self._mark_down(e)
+            log_watcher("WARN", f"Lease acquire failed for {name}: {e}")
+            return False
+        with self.lock:
+            self.held[name] = time.monotonic() + (ttl or self.ttl)
+        return True
+
+    def owns(self, name):
+        with self.lock:
+            exp = self.held.get(name)
+        return exp is not None and exp - time.monotonic() > self.ttl / 6
+
+    def renew_all(self):
+        with self.lock:
+            names = list(self.held)
+        for name in names:
+            try:
+                now = self._server_now()
+                doc = self.coll.find_one_and_update(
+                    {"_id": name, "owner": self.owner},
+                    {"$set": {"expiresAt": now + timedelta(seconds=self.ttl), "renewedAt": now}}
+                )
+            except Exception as e:
+                log_watcher("WARN", f"Lease renew failed for {name}: {e}")
+                continue
+            with self.lock:
+                if doc:
+                    self.held[name] = time.monotonic() + self.ttl
+                elif name in self.held:
+                    del self.held[name]
+                    log_watcher("LEASE", f"Lost lease: {name}")
+
+    def release(self, name):
+        with self.lock:
+            self.held.pop(name, None)
+        if self._down():
+            return
+        try:
+            self.coll.delete_one({"_id": name, "owner": self.owner})
+        except Exception as e:
+            self._mark_down(e)
+            log_watcher("WARN", f"Lease release failed for {name}: {e}")
+
+    def complete(self, name, keep_seconds=86400):
+        with self.lock:
+            self.held.pop(name, None)
+        try:
+            self.coll.update_one(
+                {"_id": name, "owner": self.owner},
+                {"$set": {"done": True, "expiresAt": self._server_now() + timedelta(seconds=keep_seconds)}}
+            )
+        except Exception as e:
+            log_watcher("WARN", f"Lease complete failed for {name}: {e}")
+
+    def clear_prefix(self, prefix):
+        try:
+            self.coll.delete_many({"_id": {"$regex": "^" + re.escape(prefix)}})
+        except Exception as e:
+            log_watcher("WARN", f"Lease clear failed for {prefix}: {e}")
+
+    def live_instances(self):
+        try:
+            return self.coll.count_documents({"_id": {"$regex": "^instance:"}, "expiresAt": {"$gt": self._server_now()}})
+        except Exception:
+            return 1
+
+    def balance(self, targets):
+        live = max(1, self.live_instances())
+        share = math.ceil(len(targets) / live)
+        owned = [t for t in targets if self.owns(f"target:{t[5]}")]
+        for t in targets:
+            if len(owned) >= share:
+                break
+            if t not in owned and self.acquire(f"target:{t[5]}"):
+                owned.append(t)
+                log_watcher("LEASE", f"Acquired target {t[5]}")
+        while len(owned) > share:
+            t = owned.pop()
+            self.release(f"target:{t[5]}")
+            log_watcher("LEASE", f"Released target {t[5]} (share={share}, instances={live})")
+        return [t for t in targets if t in owned]
+
+    def _keep_alive(self):
+        while not self.stop_event.wait(self.ttl / 3):
+            self.renew_all()
+
+    def start(self):
+        self.ensure_indexes()
+        self.acquire(f"instance:{self.owner}")
+        self.thread = threading.Thread(target=self._keep_alive, name="lease-keeper", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        with self.lock:
+            names = list(self.held)
+        for name in names:
+            self.release(name)
+
+_coordinator = None
+
+def start_coordinator():
+    global _coordinator
+    if COORDINATION_ENABLED and not _coordinator:
+        _coordinator = LeaseManager(db[LEASE_COLLECTION], INSTANCE_ID, LEASE_TTL_SECONDS).start()
+        log_watcher("CONFIG", f"Coordination enabled: instance={INSTANCE_ID}, ttl={LEASE_TTL_SECONDS}s")
+    return _coordinator
+
+def stop_coordinator():
+    global _coordinator
+    if _coordinator:
+        _coordinator.stop()
+        _coordinator = None
+
+def _owns_target(key):
+    return _coordinator is None or _coordinator.owns(f"target:{key}")
+
 class FolderHandler(FileSystemEventHandler):
     def __init__(self, coll, base_path, summary_coll, error_coll, fail_coll, key=None):
         self.collection = coll
@@ -299,17 +1480,23 @@ class FolderHandler(FileSystemEventHandler):
         }
 
         try:
-            res = self.collection.update_one(
-                {"name": name, "path": folder_path},
-                {"$setOnInsert": data},
-                upsert=True
-            )
-            if getattr(res, "upserted_id", None):
-                log_watcher("INSERT", f"Added folder: {name}")
+            if _outbox:
+                _write_one(self.collection, {"name": name, "path": folder_path}, {"$setOnInsert": data})
+                log_watcher("INSERT", f"Queued folder: {name}")
             else:
-                log_watcher("SKIP", f"Folder already exists: {name}")
+                res = self.collection.update_one(
+                    {"name": name, "path": folder_path},
+                    {"$setOnInsert": data},
+                    upsert=True
+                )
+                if getattr(res, "upserted_id", None):
+                    log_watcher("INSERT", f"Added folder: {name}")
+                else:
+                    log_watcher("SKIP", f"Folder already exists: {name}")
         except DuplicateKeyError:
             log_watcher("SKIP", f"Folder already exists (dupe key): {name}")
+        except Exception as e:
+            log_watcher("ERROR", f"Register folder {name} failed: {e}")
         try:
             process_run_folder(folder_path, self.key)
         except Exception as e:
@@ -319,17 +1506,39 @@ class FolderHandler(FileSystemEventHandler):
         update_fail_summary(self.base_path, self.fail_coll, self.key)
 
     def on_created(self, event):
+        if not _owns_target(self.key):
+            return
         try:
-            is_dir = event.is_directory or os.path.isdir(event.src_path)
-            if is_dir and os.path.dirname(event.src_path) == self.base_path:
+            if os.path.dirname(event.src_path) != self.base_path:
+                return
+            if event.is_directory or os.path.isdir(event.src_path):
                 log_watcher("EVENT", f"New folder detected: {event.src_path}")
                 self.process_folder(event.src_path)
+            elif _is_run_archive(event.src_path):
+                # A copy still in progress is picked up later by on_closed or the periodic sync.
+                if _archive_complete(event.src_path):
+                    log_watcher("EVENT", f"New archive detected: {event.src_path}")
+                    self.process_folder(event.src_path)
+                else:
+                    log_watcher("SKIP", f"Archive still being written: {event.src_path}")
         except Exception as e:
             log_watcher("ERROR", f"on_created: {e}")
 
+    def on_closed(self, event):
+        if not _owns_target(self.key):
+            return
+        try:
+            if _is_run_archive(event.src_path) and os.path.dirname(event.src_path) == self.base_path:
+                log_watcher("EVENT", f"Archive written: {event.src_path}")
+                self.process_folder(event.src_path)
+        except Exception as e:
+            log_watcher("ERROR", f"on_closed: {e}")
+
     def on_deleted(self, event):
+        if not _owns_target(self.key):
+            return
         try:
-            is_dir = event.is_directory or os.path.isdir(event.src_path)
+            is_dir = event.is_directory or os.path.isdir(event.src_path) or _has_archive_suffix(event.src_path)
             if is_dir and os.path.dirname(event.src_path) == self.base_path:
                 name = os.path.basename(event.src_path)
                 log_watcher("EVENT", f"Folder deleted: {event.src_path}")
@@ -342,8 +1551,10 @@ class FolderHandler(FileSystemEventHandler):
             log_watcher("ERROR", f"on_deleted: {e}")
 
     def on_moved(self, event):
+        if not _owns_target(self.key):
+            return
         try:
-            is_dir = event.is_directory or os.path.isdir(event.dest_path)
+            is_dir = event.is_directory or _is_run_source(event.dest_path)
             if is_dir:
                 if os.path.dirname(event.src_path) == self.base_path:
                     old_name = os.path.basename(event.src_path)
@@ -365,7 +1576,7 @@ class FolderHandler(FileSystemEventHandler):
 def sync_target(base_path, coll):
     try:
         for entry in os.scandir(base_path):
-            if entry.is_dir():
+            if _is_run_source(entry.path):
                 name = os.path.basename(entry.path)
                 try:
                     res = coll.update_one(
@@ -383,7 +1594,7 @@ def sync_target(base_path, coll):
                     pass
         for doc in coll.find({}, {"name": 1, "path": 1}):
             p = doc.get("path")
-            if isinstance(p, str) and p.startswith(base_path) and not os.path.isdir(p):
+            if isinstance(p, str) and p.startswith(base_path) and not _is_run_source(p):
                 coll.delete_one({"_id": doc["_id"]})
                 log_watcher("SYNC", f"Removed stale: {doc.get('name')}")
         for doc in coll.find({"path": {"$regex": f"^{base_path}"}}, {"name": 1, "path": 1}):
@@ -425,27 +1636,21 @@ def count_results(base_path):
     failed = 0
     skipped = 0
     try:
-        for root, dirs, files in os.walk(base_path):
-            for f in files:
-                if f.lower().endswith('.json'):
-                    fp = os.path.join(root, f)
-                    try:
-                        with open(fp) as fh:
-                            d = json.load(fh)
-                            r = d.get('result')
-                            if not r:
-                                continue
-                            v = str(r).upper()
-                            if v == 'SUCCESS':
-                                passing += 1
-                            elif v == 'ERROR':
-                                broken_flaky += 1
-                            elif v == 'FAILURE':
-                                failed += 1
-                            elif v in ('PENDING', 'SKIPPED'):
-                                skipped += 1
-                    except Exception:
-                        pass
+        for fp, f, facts in _iter_report_facts(base_path):
+            try:
+                v = facts['result']
+                if not v:
+                    continue
+                if v == 'SUCCESS':
+                    passing += 1
+                elif v == 'ERROR':
+                    broken_flaky += 1
+                elif v == 'FAILURE':
+                    failed += 1
+                elif v in ('PENDING', 'SKIPPED'):
+                    skipped += 1
+            except Exception:
+                pass
     except Exception:
         pass
     return {
@@ -481,13 +1686,13 @@ def update_summary(base_path, coll_folders, coll_summary, key=None):
         'updated_at': datetime.now()
     }
     try:
-        coll_summary.update_one({'path': base_path}, {'$set': payload}, upsert=True)
+        _write_one(coll_summary, {'path': base_path}, {'$set': payload}, upsert=True)
         log_watcher("SUMMARY", f"Upsert for {base_path}: total={counts['total']}")
     except Exception as e:
         log_watcher("ERROR", f"Summary upsert failed: {e}")
 
 def _build_run_payload(folder_path, project_key=None):
-    run_id = os.path.basename(folder_path)
+    run_id = _run_id_for(folder_path)
     sum_txt = _parse_summary_txt(folder_path)
     fallback_counts = count_results(folder_path)
     start_time_str = _extract_start_time_from_name(run_id)
@@ -521,205 +1726,225 @@ def _build_run_payload(folder_path, project_key=None):
     }
     return payload
 
+def list_run_folders(base_path, since=None, until=None):
+    out = []
+    try:
+        for entry in os.scandir(base_path):
+            if not _is_run_source(entry.path):
+                continue
+            if since or until:
+                st = _run_start_datetime(entry.path)
+                if since and st < since:
+                    continue
+                if until and st > until:
+                    continue
+            out.append(entry.path)
+    except Exception as e:
+        log_watcher("ERROR", f"List run folders failed for {base_path}: {e}")
+    return sorted(out, key=_run_id_for)
+
+def refresh_run(folder_path, project_key=None):
+    payload = _build_run_payload(folder_path, project_key)
+    _write_one(db["test-runs"], {"runId": payload["runId"]}, {"$set": payload}, upsert=True)
+    log_watcher("REFRESH", f"test-runs: {payload['runId']} updated")
+
 def refresh_runs_for_path(base_path, project_key=None):
-    coll_runs = db["test-runs"]
     ensure_run_indexes(db)
     try:
-        for entry in os.scandir(base_path):
-            if entry.is_dir():
-                p = entry.path
-                payload = _build_run_payload(p, project_key)
-                coll_runs.update_one({"runId": payload["runId"]}, {"$set": payload}, upsert=True)
-                log_watcher("REFRESH", f"test-runs: {payload['runId']} updated")
+        for p in list_run_folders(base_path):
+            refresh_run(p, project_key)
     except Exception as e:
         log_watcher("ERROR", f"refresh_runs_for_path failed: {e}")
 
+_archived_runs = set()
+
+def refresh_archived_runs(project_key):
+    try:
+        for r in db["test-runs"].find({"project": project_key, "archived": True}, {"runId": 1}):
+            _archived_runs.add(r["runId"])
+    except Exception as e:
+        log_watcher("WARN", f"Load archived runs failed for {project_key}: {e}")
+
+_run_locks = [threading.Lock() for _ in range(64)]
+
+def _run_lock(run_id):
+    return _run_locks[hash(run_id) % len(_run_locks)]
+
 def process_run_folder(folder_path, project_key=None):
-    run_id = os.path.basename(folder_path)
+    lease = f"run:{_run_id_for(folder_path)}"
+    if _coordinator and not _coordinator.acquire(lease):
+        log_watcher("SKIP", f"Run leased by another instance: {_run_id_for(folder_path)}")
+        return False
+    try:
+        with _run_lock(_run_id_for(folder_path)):
+            return _ingest_run_folder(folder_path, project_key)
+    finally:
+        if _coordinator:
+            _coordinator.release(lease)
+
+def _ingest_run_folder(folder_path, project_key=None):
+    run_id = _run_id_for(folder_path)
     coll_runs = db["test-runs"]
     coll_cases = db["test-cases"]
     coll_steps = db["test-steps"]
     coll_atts = db["attachments"]
+    if run_id in _archived_runs:
+        return False
+    if _coordinator:
+        try:
+            if coll_runs.find_one({"runId": run_id, "archived": True}, {"_id": 1}):
+                _archived_runs.add(run_id)
+                return False
+        except Exception:
+            pass
     try:
         payload = _build_run_payload(folder_path, project_key)
-        coll_runs.update_one({"runId": run_id}, {"$set": payload}, upsert=True)
+        _write_one(coll_runs, {"runId": run_id}, {"$set": payload}, upsert=True)
     except Exception as e:
         log_watcher("ERROR", f"Insert test-runs failed: {e}")
+    case_keys = []
     try:
-        for root, dirs, files in os.walk(folder_path):
-            for f in files:
-                if not f.lower().endswith(".json"):
-                    continue
-                if f in ("serenity.configuration.json", "bootstrap-icons.json", "serenity-summary.json"):
-                    continue
-                fp = os.path.join(root, f)
-                data = _read_json(fp)
-                if not isinstance(data, dict):
-                    continue
-                name = data.get("name") or data.get("title")
-                tcid = _to_snake(os.path.splitext(f)[0]) or _to_snake(name) or os.path.splitext(f)[0]
-                feature = data.get("feature")
-                story = None
-                tags_arr = []
-                tags = data.get("tags")
-                if isinstance(tags, list):
-                    for t in tags:
-                        if isinstance(t, dict):
-                            tn = t.get("name") or t.get("tag")
-                            tt = t.get("type") or t.get("tagType")
-                            if isinstance(tt, str) and tt.lower() in ("feature", "story") and not feature:
-                                feature = tn
-                            if isinstance(tt, str) and tt.lower() == "story" and not story:
-                                story = tn
-                            if tn:
-                                tags_arr.append(str(tn))
-                us = data.get("userStory")
-                if isinstance(us, dict):
-                    story = story or us.get("storyName") or us.get("name")
-                    feature = feature or us.get("path")
-                status = data.get("result")
-                duration_case = _compute_case_duration(data)
-                err = None
-                tfc = data.get("testFailureCause")
-                if isinstance(tfc, dict):
-                    err = tfc.get("message") or tfc.get("errorType")
-                elif isinstance(tfc, str):
-                    err = tfc
-                has_steps = bool(_collect_steps(data))
-                has_att = bool(data.get("attachments") or data.get("screenshots"))
-                case_doc = {
+        for fp, f, data in _iter_reports(folder_path):
+            if not isinstance(data, dict):
+                continue
+            name = data.get("name") or data.get("title")
+            tcid = _to_snake(os.path.splitext(f)[0]) or _to_snake(name) or os.path.splitext(f)[0]
+            feature = data.get("feature")
+            story = None
+            tags_arr = []
+            tags = data.get("tags")
+            if isinstance(tags, list):
+                for t in tags:
+                    if isinstance(t, dict):
+                        tn = t.get("name") or t.get("tag")
+                        tt = t.get("type") or t.get("tagType")
+                        if isinstance(tt, str) and tt.lower() in ("feature", "story") and not feature:
+                            feature = tn
+                        if isinstance(tt, str) and tt.lower() == "story" and not story:
+                            story = tn
+                        if tn:
+                            tags_arr.append(str(tn))
+            us = data.get("userStory")
+            if isinstance(us, dict):
+                story = story or us.get("storyName") or us.get("name")
+                feature = feature or us.get("path")
+            status = data.get("result")
+            duration_case = _compute_case_duration(data)
+            err = None
+            tfc = data.get("testFailureCause")
+            if isinstance(tfc, dict):
+                err = tfc.get("message") or tfc.get("errorType")
+            elif isinstance(tfc, str):
+                err = tfc
+            has_steps = bool(_collect_steps(data))
+            has_att = bool(data.get("attachments") or data.get("screenshots"))
+            case_doc = {
+                "runId": run_id,
+                "testCaseId": tcid,
+                "name": name,
+                "feature": feature,
+                "story": story,
+                "tags": tags_arr,
+                "status": str(status).upper() if status else None,
+                "duration": duration_case,
+                "errorMessage": err,
+                "hasSteps": has_steps,
+                "hasAttachment": has_att,
+                "createdAt": _utc_now()
+            }
+            try:
+                _write_one(coll_cases, {"runId": run_id, "testCaseId": tcid}, {"$set": case_doc}, upsert=True)
+            except Exception:
+                pass
+            case_keys.append(f"{tcid}:{duration_case}")
+            steps = _flatten_steps(_collect_steps(data))
+            order = 1
+            for s in steps:
+                req, res = _extract_req_res(s)
+                req = _offload_request(req)
+                res = _offload_large(res, ("body",))
+                sdoc = {
                     "runId": run_id,
                     "testCaseId": tcid,
-                    "name": name,
-                    "feature": feature,
-                    "story": story,
-                    "tags": tags_arr,
-                    "status": str(status).upper() if status else None,
-                    "duration": duration_case,
-                    "errorMessage": err,
-                    "hasSteps": has_steps,
-                    "hasAttachment": has_att,
+                    "stepOrder": order,
+                    "name": s.get("description") or s.get("name"),
+                    "status": s.get("result"),
+                    "duration": s.get("duration"),
+                    "request": req,
+                    "response": res,
+                    "error": s.get("error"),
                     "createdAt": _utc_now()
                 }
+                if s.get("result") == "FAILURE":
+                    sdoc["exception"] = s.get("exception")
+                    sdoc["reportData"] = s.get("reportData")
+                elif s.get("result") == "ERROR":
+                    sdoc["exception"] = s.get("exception")
                 try:
-                    coll_cases.update_one({"runId": run_id, "testCaseId": tcid}, {"$set": case_doc}, upsert=True)
+                    _write_one(coll_steps, {"runId": run_id, "testCaseId": tcid, "stepOrder": order}, {"$set": sdoc}, upsert=True)
                 except Exception:
                     pass
-                steps = _flatten_steps(_collect_steps(data))
-                order = 1
-                for s in steps:
-                    req, res = _extract_req_res(s)
-                    sdoc = {
-                        "runId": run_id,
-                        "testCaseId": tcid,
-                        "stepOrder": order,
-                        "name": s.get("description") or s.get("name"),
-                        "status": s.get("result"),
-                        "duration": s.get("duration"),
-                        "request": req,
-                        "response": res,
-                        "error": s.get("error"),
-                        "createdAt": _utc_now()
-                    }
-                    if s.get("result") == "FAILURE":
-                        sdoc["exception"] = s.get("exception")
-                        sdoc["reportData"] = s.get("reportData")
-                    elif s.get("result") == "ERROR":
-                        sdoc["exception"] = s.get("exception")
-                    try:
-                        coll_steps.update_one({"runId": run_id, "testCaseId": tcid, "stepOrder": order}, {"$set": sdoc}, upsert=True)
-                    except Exception:
-                        pass
-                    order += 1
-                atts = []
-                a = data.get("attachments")
-                if isinstance(a, list):
-                    for it in a:
-                        if isinstance(it, dict):
-                            atts.append(it)
-                sc = data.get("screenshots")
-                if isinstance(sc, list):
-                    for it in sc:
-                        if isinstance(it, dict):
-                            atts.append(it)
-                for it in atts:
-                    nm = it.get("name") or it.get("title")
-                    pth = it.get("path") or it.get("source")
-                    typ = it.get("type") or it.get("format")
-                    adoc = {
-                        "runId": run_id,
-                        "testCaseId": tcid,
-                        "name": nm,
-                        "type": typ,
-                        "path": pth,
-                        "createdAt": _utc_now()
-                    }
-                    try:
-                        coll_atts.update_one(
-                            {"runId": run_id, "testCaseId": tcid, "name": nm, "path": pth},
-                            {"$set": adoc},
-                            upsert=True
-                        )
-                    except Exception:
-                        pass
+                order += 1
+            atts = []
+            a = data.get("attachments")
+            if isinstance(a, list):
+                for it in a:
+                    if isinstance(it, dict):
+                        atts.append(it)
+            sc = data.get("screenshots")
+            if isinstance(sc, list):
+                for it in sc:
+                    if isinstance(it, dict):
+                        atts.append(it)
+            for it in atts:
+                nm = it.get("name") or it.get("title")
+                pth = it.get("path") or it.get("source")
+                typ = it.get("type") or it.get("format")
+                adoc = {
+                    "runId": run_id,
+                    "testCaseId": tcid,
+                    "name": nm,
+                    "type": typ,
+                    "path": pth,
+                    "createdAt": _utc_now()
+                }
+                try:
+                    _write_one(
+                        coll_atts,
+                        {"runId": run_id, "testCaseId": tcid, "name": nm, "path": pth},
+                        {"$set": adoc},
+                        upsert=True
+                    )
+                except Exception:
+                    pass
+        # A run indexed while still partial must be re-indexed once its cases or durations change.
+        case_sig = hashlib.sha1("\n".join(sorted(case_keys)).encode("utf-8")).hexdigest()
+        _write_one(coll_runs, {"runId": run_id, "caseSignature": {"$ne": case_sig}}, {"$set": {"caseSignature": case_sig}, "$unset": {"statsIndexed": ""}}, upsert=False)
+        _write_one(coll_runs, {"runId": run_id}, {"$set": {"ingestedAt": _utc_now()}}, upsert=False)
     except Exception as e:
         log_watcher("ERROR", f"Parse run folder failed: {e}")
+    return True
 
 def update_error_summary(base_path, coll_error, key=None, top_n:int=10, examples_per:int=5):
     total_error = 0
     cause_counts = {}
     cause_examples = {}
 
-    def scan(obj):
-        results = []
-        try:
-            if isinstance(obj, dict):
-                r = obj.get('result')
-                if isinstance(r, str) and r.upper() == 'ERROR':
-                    causes = obj.get('testFailureCause')
-                    tc = obj.get('testCaseName') or obj.get('title') or obj.get('name')
-                    use = []
-                    if isinstance(causes, list):
-                        use = [str(x) for x in causes if x]
-                    elif isinstance(causes, str):
-                        use = [causes]
-                    elif isinstance(causes, dict):
-                        et = causes.get('errorType')
-                        msg = causes.get('message')
-                        val = et or (msg[:200] if isinstance(msg, str) else None)
-                        if val:
-                            use = [str(val)]
-                    if use:
-                        results.append((use, tc))
-                for v in obj.values():
-                    results.extend(scan(v))
-            elif isinstance(obj, list):
-                for v in obj:
-                    results.extend(scan(v))
-        except Exception:
-            pass
-        return results
-
     try:
-        for root, dirs, files in os.walk(base_path):
-            for f in files:
-                if f.lower().endswith('.json'):
-                    fp = os.path.join(root, f)
-                    try:
-                        with open(fp) as fh:
-                            data = json.load(fh)
-                        extracted = scan(data)
-                        for causes, tc in extracted:
-                            total_error += 1
-                            for c in causes:
-                                cause_counts[c] = cause_counts.get(c, 0) + 1
-                                if tc:
-                                    arr = cause_examples.get(c) or []
-                                    if len(arr) < examples_per and tc not in arr:
-                                        arr.append(tc)
-                                    cause_examples[c] = arr
-                    except Exception:
-                        pass
+        for fp, f, facts in _iter_report_facts(base_path):
+            try:
+                extracted = facts["error"]
+                for causes, tc in extracted:
+                    total_error += 1
+                    for c in causes:
+                        cause_counts[c] = cause_counts.get(c, 0) + 1
+                        if tc:
+                            arr = cause_examples.get(c) or []
+                            if len(arr) < examples_per and tc not in arr:
+                                arr.append(tc)
+                            cause_examples[c] = arr
+            except Exception:
+                pass
 
         sorted_causes = sorted(cause_counts.items(), key=lambda x: x[1], reverse=True)
         top_causes = [c for c,_ in sorted_causes[:top_n]]
@@ -732,7 +1957,7 @@ def update_error_summary(base_path, coll_error, key=None, top_n:int=10, examples
             'ex': ex,
             'updated_at': datetime.now()
         }
-        coll_error.update_one({'path': base_path}, {'$set': payload}, upsert=True)
+        _write_one(coll_error, {'path': base_path}, {'$set': payload}, upsert=True)
         log_watcher("ERROR-SUMMARY", f"Upsert for {base_path}: totalError={total_error}, causes={len(top_causes)}")
     except Exception as e:
         log_watcher("ERROR", f"Error summary upsert failed: {e}")
@@ -742,56 +1967,21 @@ def update_fail_summary(base_path, coll_fail, key=None, top_n:int=10, examples_p
     cause_counts = {}
     cause_examples = {}
 
-    def scan(obj):
-        results = []
-        try:
-            if isinstance(obj, dict):
-                r = obj.get('result')
-                if isinstance(r, str) and r.upper() == 'FAILURE':
-                    causes = obj.get('testFailureCause')
-                    tc = obj.get('testCaseName') or obj.get('title') or obj.get('name')
-                    use = []
-                    if isinstance(causes, list):
-                        use = [str(x) for x in causes if x]
-                    elif isinstance(causes, str):
-                        use = [causes]
-                    elif isinstance(causes, dict):
-                        et = causes.get('errorType')
-                        msg = causes.get('message')
-                        val = et or (msg[:200] if isinstance(msg, str) else None)
-                        if val:
-                            use = [str(val)]
-                    if use:
-                        results.append((use, tc))
-                for v in obj.values():
-                    results.extend(scan(v))
-            elif isinstance(obj, list):
-                for v in obj:
-                    results.extend(scan(v))
-        except Exception:
-            pass
-        return results
-
     try:
-        for root, dirs, files in os.walk(base_path):
-            for f in files:
-                if f.lower().endswith('.json'):
-                    fp = os.path.join(root, f)
-                    try:
-                        with open(fp) as fh:
-                            data = json.load(fh)
-                        extracted = scan(data)
-                        for causes, tc in extracted:
-                            total_fail += 1
-                            for c in causes:
-                                cause_counts[c] = cause_counts.get(c, 0) + 1
-                                if tc:
-                                    arr = cause_examples.get(c) or []
-                                    if len(arr) < examples_per and tc not in arr:
-                                        arr.append(tc)
-                                    cause_examples[c] = arr
-                    except Exception:
-                        pass
+        for fp, f, facts in _iter_report_facts(base_path):
+            try:
+                extracted = facts["fail"]
+                for causes, tc in extracted:
+                    total_fail += 1
+                    for c in causes:
+                        cause_counts[c] = cause_counts.get(c, 0) + 1
+                        if tc:
+                            arr = cause_examples.get(c) or []
+                            if len(arr) < examples_per and tc not in arr:
+                                arr.append(tc)
+                            cause_examples[c] = arr
+            except Exception:
+                pass
 
         sorted_causes = sorted(cause_counts.items(), key=lambda x: x[1], reverse=True)
         top_causes = [c for c,_ in sorted_causes[:top_n]]
@@ -804,12 +1994,385 @@ def update_fail_summary(base_path, coll_fail, key=None, top_n:int=10, examples_p
             'ex': ex,
             'updated_at': datetime.now()
         }
-        coll_fail.update_one({'path': base_path}, {'$set': payload}, upsert=True)
+        _write_one(coll_fail, {'path': base_path}, {'$set': payload}, upsert=True)
         log_watcher("FAIL-SUMMARY", f"Upsert for {base_path}: totalFail={total_fail}, causes={len(top_causes)}")
     except Exception as e:
         log_watcher("ERROR", f"Fail summary upsert failed: {e}")
 
-if __name__ == "__main__":
+def _failure_fingerprint(message):
+    if not isinstance(message, str) or not message:
+        return None
+    norm = re.sub(r"0x[0-9a-fA-F]+|\b[0-9a-fA-F]{8,}\b|\d+", "#", message.strip().splitlines()[0])
+    norm = re.sub(r"\s+", " ", norm)
+    return hashlib.sha1(norm.encode("utf-8")).hexdigest()[:16]
+
+def archive_run(run_doc):
+    run_id = run_doc.get("runId")
+    lease = f"run:{run_id}"
+    if _coordinator and not _coordinator.acquire(lease):
+        log_watcher("SKIP", f"Run leased by another instance, archive later: {run_id}")
+        return False
+    try:
+        with _run_lock(run_id):
+            return _archive_run(run_doc)
+    finally:
+        if _coordinator:
+            _coordinator.release(lease)
+
+def _archive_run(run_doc):
+    run_id = run_doc.get("runId")
+    # Flag first so no ingest can write rows after the deletes below; queued
+    # writes from earlier ingests must land before we read the cases.
+    _archived_runs.add(run_id)
+    if not _drain_writes(60):
+        _archived_runs.discard(run_id)
+        log_watcher("WARN", f"Outbox busy, archive of {run_id} postponed")
+        return False
+    db["test-runs"].update_one({"runId": run_id}, {"$set": {"archived": True}})
+    _notify_write("test-runs", {"filter": {"runId": run_id}})
+    cases = []
+    fingerprints = {}
+    for c in db["test-cases"].find({"runId": run_id}, {"testCaseId": 1, "name": 1, "status": 1, "duration": 1, "errorMessage": 1}):
+        fp = None
+        if c.get("status") in ("FAILURE", "ERROR"):
+            fp = _failure_fingerprint(c.get("errorMessage"))
+            if fp:
+                item = fingerprints.get(fp) or {"fingerprint": fp, "message": (c.get("errorMessage") or "")[:300], "count": 0, "cases": []}
+                item["count"] += 1
+                if len(item["cases"]) < 5:
+                    item["cases"].append(c.get("testCaseId"))
+                fingerprints[fp] = item
+        cases.append({
+            "testCaseId": c.get("testCaseId"),
+            "name": c.get("name"),
+            "status": c.get("status"),
+            "duration": c.get("duration"),
+            "fingerprint": fp
+        })
+    archive = {
+        "runId": run_id,
+        "project": run_doc.get("project"),
+        "startTime": run_doc.get("startTime"),
+        "summary": run_doc.get("summary"),
+        "source": run_doc.get("source"),
+        "cases": cases,
+        "failureFingerprints": sorted(fingerprints.values(), key=lambda x: x["count"], reverse=True),
+        "archivedAt": _utc_now()
+    }
+    if cases or not db[ARCHIVE_COLLECTION].find_one({"runId": run_id}, {"_id": 1}):
+        _write_one(db[ARCHIVE_COLLECTION], {"runId": run_id}, {"$set": archive}, upsert=True)
+    for name in ("test-steps", "attachments", "test-cases"):
+        _db_write(db[name], "delete_many", {"filter": {"runId": run_id}})
+    _write_one(db["test-runs"], {"runId": run_id}, {"$set": {"archivedAt": _utc_now()}}, upsert=False)
+    log_watcher("RETENTION", f"Archived run {run_id}: cases={len(cases)}, fingerprints={len(fingerprints)}")
+    return True
+
+def apply_retention(project_key, keep_days=0, keep_runs=0, limit=20):
+    if not keep_days and not keep_runs:
+        return 0
+    try:
+        runs = list(db["test-runs"].find(
+            {"project": project_key, "archivedAt": {"$exists": False}},
+            {"runId": 1, "project": 1, "startTime": 1, "summary": 1, "source": 1}
+        ))
+    except Exception as e:
+        log_watcher("ERROR", f"Retention query failed for {project_key}: {e}")
+        return 0
+    runs.sort(key=lambda r: _parse_start_time(r.get("startTime")) or datetime.min, reverse=True)
+    cutoff = datetime.now() - timedelta(days=keep_days) if keep_days else None
+    expired = []
+    for i, r in enumerate(runs):
+        if keep_runs and i < keep_runs:
+            continue
+        st = _parse_start_time(r.get("startTime"))
+        if cutoff and (st is None or st >= cutoff):
+            continue
+        expired.append(r)
+    archived = 0
+    for r in reversed(expired[-limit:] if limit else expired):
+        try:
+            if archive_run(r):
+                archived += 1
+        except Exception as e:
+            log_watcher("ERROR", f"Archive run {r.get('runId')} failed: {e}")
+    return archived
+
+class RetentionWorker(threading.Thread):
+    def __init__(self, targets, interval=RETENTION_INTERVAL_SECONDS, batch=RETENTION_BATCH):
+        super().__init__(name="retention", daemon=True)
+        self.targets = targets
+        self.interval = interval
+        self.batch = batch
+        self.stop_event = threading.Event()
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            for item in self.targets:
+                k = item[5]
+                if not _owns_target(k):
+                    continue
+                opts = TARGET_OPTIONS.get(k) or {}
+                days = int(opts.get("retention_days", RETENTION_DAYS) or 0)
+                runs = int(opts.get("retention_runs", RETENTION_RUNS) or 0)
+                if self.stop_event.is_set():
+                    return
+                apply_retention(k, days, runs, self.batch)
+            if BLOB_THRESHOLD_BYTES > 0 and not self.stop_event.is_set():
+                if not _coordinator or _coordinator.acquire("blob-sweep", self.interval):
+                    sweep_blobs()
+
+    def stop(self):
+        self.stop_event.set()
+
+def _percentiles(values, qs):
+    arr = sorted(values)
+    n = len(arr)
+    out = []
+    for q in qs:
+        pos = (n - 1) * q / 100.0
+        lo = int(math.floor(pos))
+        hi = min(lo + 1, n - 1)
+        out.append(arr[lo] + (arr[hi] - arr[lo]) * (pos - lo))
+    return out
+
+def compute_duration_stats(series, ma_window=STATS_MA_WINDOW, min_samples=STATS_MIN_SAMPLES, factor=STATS_REGRESSION_FACTOR):
+    """series: {testCaseId: durations ordered oldest -> newest}; returns {testCaseId: stats}."""
+    keys = [k for k, v in series.items() if len(v)]
+    if not keys:
+        return {}
+    out = {}
+    if np is not None:
+        width = max(len(series[k]) for k in keys)
+        m = np.full((len(keys), width), np.nan)
+        for i, k in enumerate(keys):
+            v = series[k]
+            m[i, width - len(v):] = np.asarray(v, dtype=float)
+        counts = np.sum(~np.isnan(m), axis=1)
+        p50, p95, p99 = np.nanpercentile(m, [50, 95, 99], axis=1)
+        mean = np.nanmean(m, axis=1)
+        ma = np.nanmean(m[:, -ma_window:], axis=1)
+        base = m[:, :-ma_window] if width > ma_window else np.full((len(keys), 1), np.nan)
+        has_base = np.any(~np.isnan(base), axis=1)
+        base_p50 = np.full(len(keys), np.nan)
+        if has_base.any():
+            base_p50[has_base] = np.nanmedian(base[has_base], axis=1)
+        for i, k in enumerate(keys):
+            out[k] = (int(counts[i]), float(p50[i]), float(p95[i]), float(p99[i]), float(mean[i]), float(ma[i]),
+                      float(base_p50[i]) if has_base[i] else None)
+    else:
+        for k in keys:
+            v = array("d", series[k])
+            p50, p95, p99 = _percentiles(v, (50, 95, 99))
+            recent = v[-ma_window:]
+            older = v[:-ma_window] if len(v) > ma_window else array("d")
+            out[k] = (len(v), p50, p95, p99, sum(v) / len(v), sum(recent) / len(recent),
+                      _percentiles(older, (50,))[0] if len(older) else None)
+    result = {}
+    for k, (n, p50, p95, p99, mean, ma, base_p50) in out.items():
+        ratio = ma / base_p50 if base_p50 else None
+        result[k] = {
+            "count": n,
+            "p50": round(p50, 1),
+            "p95": round(p95, 1),
+            "p99": round(p99, 1),
+            "mean": round(mean, 1),
+            "movingAvg": round(ma, 1),
+            "baselineP50": round(base_p50, 1) if base_p50 is not None else None,
+            "regressionRatio": round(ratio, 3) if ratio is not None else None,
+            "regression": bool(ratio is not None and n >= min_samples and ratio >= factor)
+        }
+    return result
+
+def _run_sort_key(start_time, run_id):
+    return (_parse_start_time(start_time) or datetime.min, run_id or "")
+
+def update_case_stats(project_key, batch_runs=STATS_BATCH_RUNS):
+    try:
+        runs = list(db["test-runs"].find(
+            # A run flagged archived but without archivedAt is mid-archive: its cases may be gone
+            # and its archive document not written yet, so wait for the next round.
+            {"project": project_key, "statsIndexed": {"$ne": True}, "$or": [
+                {"ingestedAt": {"$exists": True}, "archived": {"$ne": True}},
+                {"archivedAt": {"$exists": True}}
+            ]},
+            {"runId": 1, "startTime": 1, "archivedAt": 1, "caseSignature": 1}
+        ))
+    except Exception as e:
+        log_watcher("ERROR", f"Case stats query failed for {project_key}: {e}")
+        return 0
+    if not runs:
+        return 0
+    runs.sort(key=lambda r: _run_sort_key(r.get("startTime"), r.get("runId")))
+    runs = runs[:batch_runs]
+    starts = {r["runId"]: r.get("startTime") for r in runs}
+    new = {}
+    names = {}
+
+    def add(run_id, tcid, name, duration):
+        if tcid and isinstance(duration, (int, float)):
+            new.setdefault(tcid, []).append((starts.get(run_id), run_id, duration))
+            if name:
+                names[tcid] = name
+
+    try:
+        live_ids = [r["runId"] for r in runs if not r.get("archivedAt")]
+        archived_ids = [r["runId"] for r in runs if r.get("archivedAt")]
+        if live_ids:
+            for c in db["test-cases"].find({"runId": {"$in": live_ids}}, {"runId": 1, "testCaseId": 1, "name": 1, "duration": 1}):
+                add(c.get("runId"), c.get("testCaseId"), c.get("name"), c.get("duration"))
+        if archived_ids:
+            for a in db[ARCHIVE_COLLECTION].find({"runId": {"$in": archived_ids}}, {"runId": 1, "cases": 1}):
+                for c in a.get("cases") or []:
+                    add(a.get("runId"), c.get("testCaseId"), c.get("name"), c.get("duration"))
+        existing = {}
+        if new:
+            for d in db[STATS_COLLECTION].find({"project": project_key, "testCaseId": {"$in": list(new)}}):
+                existing[d["testCaseId"]] = d
+    except Exception as e:
+        log_watcher("ERROR", f"Case stats load failed for {project_key}: {e}")
+        return 0
+
+    series = {}
+    windows = {}
+    for tcid, samples in new.items():
+        old = existing.get(tcid) or {}
+        merged = {}
+        for st, rid, dur in zip(old.get("startTimes") or [], old.get("runIds") or [], old.get("durations") or []):
+            merged[rid] = (st, rid, dur)
+        for st, rid, dur in samples:
+            merged[rid] = (st, rid, dur)
+        ordered = sorted(merged.values(), key=lambda x: _run_sort_key(x[0], x[1]))[-STATS_WINDOW:]
+        windows[tcid] = ordered
+        series[tcid] = [x[2] for x in ordered]
+    stats = compute_duration_stats(series)
+    regressions = 0
+    try:
+        for tcid, st in stats.items():
+            ordered = windows[tcid]
+            doc = dict(st)
+            doc.update({
+                "project": project_key,
+                "testCaseId": tcid,
+                "name": names.get(tcid) or (existing.get(tcid) or {}).get("name"),
+                "durations": [x[2] for x in ordered],
+                "runIds": [x[1] for x in ordered],
+                "startTimes": [x[0] for x in ordered],
+                "lastRunId": ordered[-1][1],
+                "updatedAt": _utc_now()
+            })
+            regressions += 1 if st["regression"] else 0
+            _write_one(db[STATS_COLLECTION], {"project": project_key, "testCaseId": tcid}, {"$set": doc}, upsert=True)
+        # Only mark runs whose cases are unchanged since they were read; a re-ingest in
+        # between changes caseSignature and leaves the run for the next round.
+        for r in runs:
+            _write_one(db["test-runs"], {"runId": r["runId"], "caseSignature": r.get("caseSignature")}, {"$set": {"statsIndexed": True}}, upsert=False)
+    except Exception as e:
+        log_watcher("ERROR", f"Case stats write failed for {project_key}: {e}")
+        return 0
+    log_watcher("STATS", f"{project_key}: runs={len(runs)}, cases={len(stats)}, regressions={regressions}")
+    return len(runs)
+
+def reset_case_stats(project_key):
+    _db_write(db[STATS_COLLECTION], "delete_many", {"filter": {"project": project_key}})
+    _db_write(db["test-runs"], "update_many", {
+        "filter": {"project": project_key},
+        "update": {"$unset": {"statsIndexed": ""}},
+        "upsert": False
+    })
+
+class ReadApiHandler(BaseHTTPRequestHandler):
+    targets = {}
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _send(self, code, body):
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        try:
+            url = urlparse(self.path)
+            parts = [unquote(p) for p in url.path.strip("/").split("/") if p]
+            qs = parse_qs(url.query)
+            routed = self.route(parts, qs)
+            if routed is None:
+                self._send(404, b'{"error": "not found"}')
+                return
+            if routed is False:
+                self._send(400, b'{"error": "bad request"}')
+                return
+            key, tags, loader = routed
+            body = _query_cache.get_or_load(key, tags, lambda: json_util.dumps(loader(), json_options=json_util.RELAXED_JSON_OPTIONS).encode("utf-8")) if key else json.dumps(loader()).encode("utf-8")
+            self._send(200, body)
+        except Exception as e:
+            log_watcher("ERROR", f"API {self.path}: {e}")
+            self._send(500, json.dumps({"error": str(e)}).encode("utf-8"))
+
+    def route(self, parts, qs):
+        if parts == ["stats"]:
+            return None, None, lambda: {"cache": _query_cache.stats(), "reports": _report_cache.stats() if _report_cache else None, "facts": _facts_cache.stats() if _facts_cache else None, "outbox": _outbox.stats() if _outbox else None}
+        if parts == ["targets"]:
+            return "targets", [], lambda: [{"key": k, "path": t[0], "collection": t[1].name} for k, t in self.targets.items()]
+        if len(parts) == 3 and parts[0] == "targets" and parts[1] in self.targets:
+            p, coll, s, e, f, k = self.targets[parts[1]]
+            if parts[2] == "summary":
+                return f"summary:{k}", [s.name, e.name, f.name], lambda: {
+                    "summary": s.find_one({"path": p}, {"_id": 0}),
+                    "error": e.find_one({"path": p}, {"_id": 0}),
+                    "fail": f.find_one({"path": p}, {"_id": 0})
+                }
+            if parts[2] == "runs":
+                try:
+                    limit = max(1, min(500, int((qs.get("limit") or ["20"])[0])))
+                except ValueError:
+                    return False
+                return f"runs:{k}:{limit}", ["test-runs"], lambda: list(
+                    db["test-runs"].find({"project": k}, {"_id": 0}).sort("startTime", -1).limit(limit)
+                )
+            if parts[2] == "causes":
+                return f"causes:{k}", [e.name, f.name], lambda: {
+                    "error": e.find_one({"path": p}, {"_id": 0, "totalError": 1, "rootCause": 1, "ex": 1}),
+                    "fail": f.find_one({"path": p}, {"_id": 0, "totalFail": 1, "rootCause": 1, "ex": 1})
+                }
+        if len(parts) == 3 and parts[0] == "runs" and parts[2] == "cases":
+            run_id = parts[1]
+            def load_cases():
+                cases = list(db["test-cases"].find({"runId": run_id}, {"_id": 0}))
+                if not cases:
+                    archive = db[ARCHIVE_COLLECTION].find_one({"runId": run_id}, {"_id": 0, "cases": 1})
+                    cases = (archive or {}).get("cases") or []
+                return cases
+            return f"cases:{run_id}", [f"test-cases:{run_id}", f"{ARCHIVE_COLLECTION}:{run_id}"], load_cases
+        return None
+
+def start_read_api(targets):
+    global _query_cache
+    if not API_ENABLED:
+        return None
+    ttl = API_CACHE_TTL_SECONDS
+    if COORDINATION_ENABLED:
+        # Other instances' writes never invalidate this cache; bound staleness by the sync interval.
+        ttl = min(ttl, SYNC_INTERVAL_SECONDS)
+    _query_cache = QueryCache(API_CACHE_MAX_ENTRIES, ttl)
+    ReadApiHandler.targets = {t[5]: t for t in targets}
+    try:
+        server = ThreadingHTTPServer((API_HOST, API_PORT), ReadApiHandler)
+    except Exception as e:
+        log_watcher("ERROR", f"Read API failed to start: {e}")
+        _query_cache = None
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="read-api", daemon=True).start()
+    log_watcher("INFO", f"Read API listening on http://{API_HOST}:{API_PORT}")
+    return server
+
+TARGET_OPTIONS = {}
+
+def load_targets():
     targets_cfg = config.get("targets") if isinstance(config, dict) else None
     targets = []
     if targets_cfg:
@@ -821,6 +2384,7 @@ if __name__ == "__main__":
             f = t.get("fail_collection")
             k = t.get("key") or c
             if p and c:
+                TARGET_OPTIONS[k] = t
                 targets.append((p, db[c], db[s] if s else db[c+"-summary"], db[e] if e else db[c+"-error"], db[f] if f else db[c+"-fail"], k))
     else:
         if WATCH_PATH and COLLECTION_NAME:
@@ -833,28 +2397,206 @@ if __name__ == "__main__":
             valid_targets.append(item)
         else:
             log_watcher("WARN", f"Watch path not found: {p} (skipped)")
-    targets = valid_targets
+    return valid_targets
+
+def _select_targets(targets, names):
+    if not names:
+        return targets
+    return [t for t in targets if t[5] in names or t[1].name in names or t[0] in names]
+
+def _checkpoint_id(job, key):
+    return f"{job}:{key}"
+
+def load_checkpoint(job, key):
+    try:
+        return db[CHECKPOINT_COLLECTION].find_one({"_id": _checkpoint_id(job, key)})
+    except Exception as e:
+        log_watcher("WARN", f"Load checkpoint failed: {e}")
+        return None
+
+def _drain_writes(timeout=None):
+    if _outbox:
+        return _outbox.drain(timeout)
+    return True
+
+def save_checkpoint(job, key, run_id, done_count, failed=None):
+    try:
+        db[CHECKPOINT_COLLECTION].update_one(
+            {"_id": _checkpoint_id(job, key)},
+            {"$set": {"job": job, "key": key, "lastRunId": run_id, "processed": done_count, "failed": failed or [], "updated_at": datetime.now()}},
+            upsert=True
+        )
+    except Exception as e:
+        log_watcher("WARN", f"Save checkpoint failed: {e}")
+
+def clear_checkpoint(job, key):
+    try:
+        db[CHECKPOINT_COLLECTION].delete_one({"_id": _checkpoint_id(job, key)})
+    except Exception as e:
+        log_watcher("WARN", f"Clear checkpoint failed: {e}")
+
+def load_done_runs(job, key):
+    try:
+        cur = db[CHECKPOINT_COLLECTION].find({"job": job, "key": key, "runId": {"$exists": True}}, {"runId": 1})
+        return {d["runId"] for d in cur}
+    except Exception as e:
+        log_watcher("WARN", f"Load done runs failed: {e}")
+        return set()
+
+def mark_run_done(job, key, run_id):
+    try:
+        db[CHECKPOINT_COLLECTION].update_one(
+            {"_id": f"{_checkpoint_id(job, key)}:{run_id}"},
+            {"$set": {"job": job, "key": key, "runId": run_id, "doneAt": datetime.now()}},
+            upsert=True
+        )
+    except Exception as e:
+        log_watcher("WARN", f"Mark run done failed: {e}")
+
+def clear_done_runs(job, key):
+    try:
+        db[CHECKPOINT_COLLECTION].delete_many({"job": job, "key": key, "runId": {"$exists": True}})
+    except Exception as e:
+        log_watcher("WARN", f"Clear done runs failed: {e}")
+
+def run_job(job, target, fn, since=None, until=None, reset=False):
+    p, coll, s, e, f, k = target
+    if reset:
+        clear_checkpoint(job, k)
+        if _coordinator:
+            clear_done_runs(job, k)
+            _coordinator.clear_prefix(f"job:{job}:{k}:")
+    cp = load_checkpoint(job, k)
+    last = cp.get("lastRunId") if cp else None
+    done = cp.get("processed", 0) if cp else 0
+    folders = list_run_folders(p, since, until)
+    if _coordinator:
+        # Instances share the job run by run, so a single lastRunId cannot describe progress;
+        # per-run done markers (kept until --reset) do, and unlike job leases they never expire.
+        finished = load_done_runs(job, k)
+        if finished:
+            folders = [x for x in folders if _run_id_for(x) not in finished]
+            log_watcher("RESUME", f"{job} {k}: {len(finished)} run(s) already done, {len(folders)} remaining")
+    elif last:
+        folders = [x for x in folders if _run_id_for(x) > last]
+        log_watcher("RESUME", f"{job} {k}: after {last}, {len(folders)} remaining")
+    failed = []
+    for fp in folders:
+        run_id = _run_id_for(fp)
+        lease = f"job:{job}:{k}:{run_id}"
+        if _coordinator and not _coordinator.acquire(lease):
+            continue
+        try:
+            ok = fn(fp, k)
+            _drain_writes()
+        except Exception as ex:
+            log_watcher("ERROR", f"{job} {run_id}: {ex}")
+            if _coordinator:
+                _coordinator.release(lease)
+            failed.append(run_id)
+            save_checkpoint(job, k, last, done, failed)
+            continue
+        if _coordinator:
+            if ok is False:
+                _coordinator.release(lease)
+                continue
+            mark_run_done(job, k, run_id)
+            _coordinator.complete(lease)
+        done += 1
+        if not failed:
+            last = run_id
+        save_checkpoint(job, k, last, done, failed)
+    _drain_writes()
+    if failed:
+        log_watcher("WARN", f"{job} {k}: {len(failed)} run(s) failed ({', '.join(failed[:5])}); checkpoint kept at {last}, rerun to retry")
+        return
+    clear_checkpoint(job, k)
+    log_watcher("JOB", f"{job} {k}: done, processed={done}")
+
+def resummarize(target):
+    p, coll, s, e, f, k = target
+    update_summary(p, coll, s, k)
+    update_error_summary(p, e, k)
+    update_fail_summary(p, f, k)
+
+def _cli_time(v):
+    dt = _parse_start_time(v)
+    if not dt:
+        raise argparse.ArgumentTypeError(f"invalid time: {v} (expected YYYY-MM-DD or 'YYYY-MM-DD HH:MM')")
+    return dt
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Watch Serenity report_history folders and ingest runs into MongoDB.")
+    sub = parser.add_subparsers(dest="command")
+    for name, help_text in (("backfill", "parse run folders into test-runs/test-cases/test-steps/attachments"),
+                            ("refresh-runs", "rebuild test-runs documents only"),
+                            ("resummarize", "recompute summary, error and fail collections"),
+                            ("analyze", "update per-test-case duration statistics in test-case-stats")):
+        sp = sub.add_parser(name, help=help_text)
+        sp.add_argument("--target", action="append", help="target key, collection or watch_path (repeatable)")
+        sp.add_argument("--since", type=_cli_time, help="only runs started at or after this time")
+        sp.add_argument("--until", type=_cli_time, help="only runs started at or before this time")
+        sp.add_argument("--reset", action="store_true", help="ignore the saved checkpoint and start over")
+        sp.add_argument("--max-ops", type=float, default=BACKFILL_MAX_OPS, help="write ceiling in operations/second (0 = unlimited)")
+        sp.add_argument("--max-mb", type=float, default=BACKFILL_MAX_MB, help="write ceiling in MB/second (0 = unlimited)")
+    return parser
+
+def run_command(args, targets):
+    targets = _select_targets(targets, args.target)
     if not targets:
-        log_watcher("FATAL", "No valid watch paths found. Please update config.json or environment.")
+        log_watcher("FATAL", f"No target matches: {args.target}")
         raise SystemExit(1)
+    set_write_limit(args.max_ops, args.max_mb)
+    ensure_run_indexes(db)
+    start_coordinator()
+    for item in targets:
+        refresh_archived_runs(item[5])
+        if args.command == "backfill":
+            run_job("backfill", item, process_run_folder, args.since, args.until, args.reset)
+            resummarize(item)
+        elif args.command == "refresh-runs":
+            run_job("refresh-runs", item, refresh_run, args.since, args.until, args.reset)
+        elif args.command == "resummarize":
+            resummarize(item)
+        elif args.command == "analyze":
+            if args.reset:
+                reset_case_stats(item[5])
+                _drain_writes()
+            while update_case_stats(item[5]):
+                _drain_writes()
+    _drain_writes()
+    stop_coordinator()
+
+def _full_pass(item, label):
+    p, coll, s, e, f, k = item
+    if REFRESH_TEST_RUNS:
+        refresh_runs_for_path(p, k)
+    sync_target(p, coll)
+    refresh_archived_runs(k)
+    try:
+        for entry in os.scandir(p):
+            if _is_run_source(entry.path):
+                process_run_folder(entry.path, k)
+    except Exception as _e:
+        log_watcher("WARN", f"{label} run parse failed for {p}: {_e}")
+    update_summary(p, coll, s, k)
+    update_error_summary(p, e, k)
+    update_fail_summary(p, f, k)
+    if ANALYTICS_ENABLED:
+        update_case_stats(k)
+
+def _owned_targets(targets):
+    return _coordinator.balance(targets) if _coordinator else targets
 
+def run_watcher(targets):
+    start_coordinator()
     for item in targets:
         p, coll, s, e, f, k = item
         deduplicate(coll, p)
         ensure_indexes(coll)
         ensure_run_indexes(db)
-        if REFRESH_TEST_RUNS:
-            refresh_runs_for_path(p, k)
-        sync_target(p, coll)
-        try:
-            for entry in os.scandir(p):
-                if entry.is_dir():
-                    process_run_folder(entry.path, k)
-        except Exception as _e:
-            log_watcher("WARN", f"Initial run parse failed for {p}: {_e}")
-        update_summary(p, coll, s, k)
-        update_error_summary(p, e, k)
-        update_fail_summary(p, f, k)
+    for item in _owned_targets(targets):
+        _full_pass(item, "Initial")
 
     observer = Observer()
     handlers = []
@@ -864,6 +2606,11 @@ if __name__ == "__main__":
         handlers.append(h)
         observer.schedule(h, p, recursive=RECURSIVE)
     observer.start()
+    api = start_read_api(targets)
+    retention = None
+    if BLOB_THRESHOLD_BYTES > 0 or RETENTION_DAYS or RETENTION_RUNS or any(o.get("retention_days") or o.get("retention_runs") for o in TARGET_OPTIONS.values()):
+        retention = RetentionWorker(targets)
+        retention.start()
 
     last_sync = time.time()
     try:
@@ -872,22 +2619,35 @@ if __name__ == "__main__":
             if REFRESH_TEST_RUNS and EXIT_AFTER_REFRESH:
                 break
             if time.time() - last_sync >= SYNC_INTERVAL_SECONDS:
-                for item in targets:
-                    p, coll, s, e, f, k = item
-                    if REFRESH_TEST_RUNS:
-                        refresh_runs_for_path(p, k)
-                    sync_target(p, coll)
-                    try:
-                        for entry in os.scandir(p):
-                            if entry.is_dir():
-                                process_run_folder(entry.path, k)
-                    except Exception as _e:
-                        log_watcher("WARN", f"Periodic run parse failed for {p}: {_e}")
-                    update_summary(p, coll, s, k)
-                    update_error_summary(p, e, k)
-                    update_fail_summary(p, f, k)
+                for item in _owned_targets(targets):
+                    _full_pass(item, "Periodic")
+                log_outbox_stats()
+                log_cache_stats()
                 last_sync = time.time()
     except KeyboardInterrupt:
-        observer.stop()
-
+        pass
+    if retention:
+        retention.stop()
+    if api:
+        api.shutdown()
+    observer.stop()
     observer.join()
+    stop_coordinator()
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    targets = load_targets()
+    if not targets:
+        log_watcher("FATAL", "No valid watch paths found. Please update config.json or environment.")
+        raise SystemExit(1)
+    start_outbox()
+    try:
+        if args.command:
+            run_command(args, targets)
+        else:
+            run_watcher(targets)
+    finally:
+        stop_outbox()
+
+if __name__ == "__main__":
+    main()